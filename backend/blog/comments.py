@@ -0,0 +1,54 @@
+"""
+Comment threads.
+
+Top-level comments are paged newest first and replies oldest first, both
+by keyset on the comment id over the (post_id, reply_id, id) index, so a
+page costs the same on a post with ten comments or a million. Each comment
+carries its direct reply count so clients only expand the threads asked for.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment
+
+
+COMMENT_PAGE_SIZE = 20
+REPLY_PAGE_SIZE = 10
+COMMENT_MAX_PAGE_SIZE = 100
+
+
+def _with_reply_counts(qs):
+    replies = (
+        Comment.objects.filter(reply_id=OuterRef('pk'))
+        .order_by().values('reply_id').annotate(n=Count('*')).values('n')
+    )
+    return qs.select_related('name__profile').annotate(
+        replies_count=Coalesce(Subquery(replies, output_field=IntegerField()), 0)
+    )
+
+
+def top_level_comments(post_id, before=None, limit=COMMENT_PAGE_SIZE):
+    """Page of a post's top-level comments older than `before`. Returns (comments, has_more)"""
+    comments = Comment.objects.filter(post_id=post_id, reply=None)
+    if before:
+        comments = comments.filter(id__lt=before)
+    page = list(_with_reply_counts(comments).order_by('-id')[:limit + 1])
+    return page[:limit], len(page) > limit
+
+
+def replies(comment, after=None, limit=REPLY_PAGE_SIZE):
+    """Page of direct replies to `comment` newer than `after`. Returns (replies, has_more)"""
+    comments = Comment.objects.filter(post_id=comment.post_id, reply_id=comment.id)
+    if after:
+        comments = comments.filter(id__gt=after)
+    page = list(_with_reply_counts(comments).order_by('id')[:limit + 1])
+    return page[:limit], len(page) > limit
+
+
+def liked_comment_ids(user, comment_ids):
+    """Which of `comment_ids` the user has liked, in one query"""
+    if not comment_ids or user is None or not getattr(user, 'is_authenticated', False):
+        return set()
+    return set(Comment.likes.through.objects.filter(
+        user_id=user.id, comment_id__in=comment_ids
+    ).values_list('comment_id', flat=True))
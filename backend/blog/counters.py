@@ -0,0 +1,100 @@
+"""
+Denormalized like/save/comment counters.
+
+`Post.likes_count`, `Post.saves_count`, `Post.comments_count` and
+`Comment.likes_count` are adjusted with F() expressions whenever the
+underlying rows change, so listing a page of posts reads the counts straight
+off the rows. Likes and saves made through the views go through
+`add_related`/`remove_related`, which move a counter only by the join rows
+the statement actually inserted or deleted, so double taps can't skew it.
+Other M2M writes (admin, shell) recount the affected rows from blog.signals,
+and `reconcile` recounts everything to repair any drift.
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Post
+
+
+def adjust(model, pks, field, delta):
+    """Add `delta` to `field` on the given rows in one UPDATE, never below zero"""
+    if not pks or not delta:
+        return
+    model.objects.filter(pk__in=pks).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def _actual_count(through, fk, **filters):
+    """Correlated COUNT(*) over rows of `through` pointing at the outer row"""
+    counts = (
+        through.objects.filter(**{fk: OuterRef('pk')}, **filters)
+        .order_by().values(fk).annotate(n=Count('*')).values('n')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+# (model, counter field, source of the true count)
+COUNTERS = [
+    (Post, 'likes_count', lambda: _actual_count(Post.likes.through, 'post_id')),
+    (Post, 'saves_count', lambda: _actual_count(Post.saves.through, 'post_id')),
+    (Post, 'comments_count', lambda: _actual_count(Comment, 'post_id', reply=None)),
+    (Comment, 'likes_count', lambda: _actual_count(Comment.likes.through, 'comment_id')),
+]
+
+# M2M join table -> (counted model, counter field, join column of the counted model)
+COUNTED_M2M = {
+    Post.likes.through: (Post, 'likes_count', 'post_id'),
+    Post.saves.through: (Post, 'saves_count', 'post_id'),
+    Comment.likes.through: (Comment, 'likes_count', 'comment_id'),
+}
+
+
+def recount(model, field, pks):
+    """Set `field` on the given rows to its true count"""
+    if not pks:
+        return
+    actual = next(actual for m, f, actual in COUNTERS if m is model and f == field)
+    model.objects.filter(pk__in=pks).update(**{field: actual()})
+
+
+def add_related(through, obj_pk, user_id):
+    """
+    Link the user to a counted row (e.g. like a post) and bump its counter
+    if this call inserted the join row. Returns True if it did.
+    """
+    model, field, fk = COUNTED_M2M[through]
+    with transaction.atomic():
+        _, created = through.objects.get_or_create(**{fk: obj_pk, 'user_id': user_id})
+        if created:
+            adjust(model, [obj_pk], field, 1)
+    return created
+
+
+def remove_related(through, obj_pk, user_id):
+    """
+    Unlink the user from a counted row and drop its counter by the join rows
+    actually deleted. Returns True if there was one.
+    """
+    model, field, fk = COUNTED_M2M[through]
+    with transaction.atomic():
+        deleted, _ = through.objects.filter(**{fk: obj_pk, 'user_id': user_id}).delete()
+        adjust(model, [obj_pk], field, -deleted)
+    return bool(deleted)
+
+
+def reconcile(dry_run=False):
+    """
+    Recount every counter from its source table.
+    Returns {'<Model>.<field>': number of rows that had drifted}.
+    """
+    drifted = {}
+    for model, field, actual in COUNTERS:
+        stale = model.objects.annotate(actual=actual()).exclude(**{field: F('actual')})
+        label = f'{model.__name__}.{field}'
+        if dry_run:
+            drifted[label] = stale.count()
+        else:
+            drifted[label] = model.objects.filter(
+                pk__in=stale.values('pk')
+            ).update(**{field: actual()})
+    return drifted
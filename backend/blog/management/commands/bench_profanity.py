@@ -0,0 +1,50 @@
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from blog import profanity
+
+
+SAMPLE_WORDS = (
+    'the quick brown fox jumps over lazy dog hello world great post thanks '
+    'for sharing this is awesome see you tomorrow'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the compiled profanity filter against better_profanity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--texts', type=int, default=1000)
+        parser.add_argument('--words', type=int, default=40, help='Words per text')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        bad_words = profanity.load_words()
+        texts = []
+        for _ in range(options['texts']):
+            words = [rng.choice(SAMPLE_WORDS) for _ in range(options['words'])]
+            # Roughly one in ten texts contains a (sometimes leetspeak) bad word
+            if rng.random() < 0.1:
+                words[rng.randrange(len(words))] = rng.choice(bad_words).replace('s', '$')
+            texts.append(' '.join(words))
+
+        engines = {'compiled': profanity.censor}
+        try:
+            from better_profanity import profanity as better_profanity
+            better_profanity.load_censor_words()
+            engines['better_profanity'] = better_profanity.censor
+        except ImportError:
+            self.stdout.write('better_profanity is not installed, benchmarking the compiled filter only')
+
+        build = min(timeit.repeat(lambda: profanity.ProfanityFilter(bad_words), number=1, repeat=options['repeat']))
+        self.stdout.write(f'Automaton build ({len(bad_words)} words): {build * 1000:.1f} ms')
+
+        for name, censor in engines.items():
+            best = min(timeit.repeat(lambda: [censor(t) for t in texts], number=1, repeat=options['repeat']))
+            self.stdout.write(
+                f'{name:>16}: {best * 1000:8.1f} ms for {len(texts)} texts '
+                f'({best / len(texts) * 1e6:.1f} us/text)'
+            )
@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from blog import timeline
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized home timelines (all users, or the given usernames)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        count = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            timeline.rebuild(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} timelines'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from blog import counters
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized like/save/comment counters and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted rows without fixing them')
+
+    def handle(self, *args, **options):
+        drifted = counters.reconcile(dry_run=options['dry_run'])
+        verb = 'drifted' if options['dry_run'] else 'repaired'
+        for label, count in drifted.items():
+            self.stdout.write(f'{label}: {count} {verb}')
+        self.stdout.write(self.style.SUCCESS(f'{sum(drifted.values())} rows {verb}'))
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:10
+
+from django.db import migrations
+
+
+# Frozen copies of blog.timeline's settings at the time of this migration
+FANOUT_FOLLOWER_LIMIT = 5000
+BACKFILL_POSTS = 50
+
+
+def backfill_timelines(apps, schema_editor):
+    """Give every existing user the timeline fan-out on write would have built"""
+    Post = apps.get_model('blog', 'Post')
+    TimelineEntry = apps.get_model('blog', 'TimelineEntry')
+    Follow = apps.get_model('users', 'Profile').following.through
+
+    author_ids = Post.objects.order_by().values_list('author_id', flat=True).distinct()
+    for author_id in author_ids.iterator():
+        posts = list(
+            Post.objects.filter(author_id=author_id)
+            .order_by('-date_posted').values_list('id', 'date_posted')[:BACKFILL_POSTS]
+        )
+        recipients = [author_id]
+        followers = list(Follow.objects.filter(to_profile__user_id=author_id).values_list('from_profile__user_id', flat=True))
+        # Posts of high-follower authors are merged in when feeds are read
+        if len(followers) <= FANOUT_FOLLOWER_LIMIT:
+            recipients.extend(followers)
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, post_id=post_id, date_posted=date_posted)
+                for user_id in recipients
+                for post_id, date_posted in posts
+            ],
+            ignore_conflicts=True,
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_comment_post_reply_id_idx'),
+        ('users', '0013_profile_last_seen_profile_show_online_status_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
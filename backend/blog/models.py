@@ -14,12 +14,16 @@ class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     likes = models.ManyToManyField(User, related_name="blogpost", blank=True)
     saves = models.ManyToManyField(User, related_name="blogsave", blank=True)
+    # Denormalized counters kept in step by blog.signals (top-level comments only)
+    likes_count = models.PositiveIntegerField(default=0)
+    saves_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
 
     def total_likes(self):
-        return self.likes.count()
+        return self.likes_count
 
     def total_saves(self):
-        return self.saves.count()
+        return self.saves_count
 
     def __str__(self):
         return self.title
@@ -36,9 +40,16 @@ class Comment(models.Model):
     date_added = models.DateTimeField(auto_now_add=True)
     likes = models.ManyToManyField(User, related_name="blogcomment", blank=True)
     reply = models.ForeignKey('self', null=True, related_name="replies", on_delete=models.CASCADE)
+    likes_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Top-level pages (reply IS NULL) and reply pages, both by id
+            models.Index(fields=['post', 'reply', 'id'], name='comment_post_reply_id_idx'),
+        ]
 
     def total_clikes(self):
-        return self.likes.count()
+        return self.likes_count
 
     def __str__(self):
         return '%s - %s - %s' %(self.post.title, self.name, self.id)
@@ -46,3 +57,22 @@ class Comment(models.Model):
     def get_absolute_url(self):
         return reverse('post-detail', kwargs={"pk":self.pk})
 
+
+
+""" Materialized home timeline """
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, related_name="timeline_entries", on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name="timeline_entries", on_delete=models.CASCADE)
+    # Copied from the post so a page of the feed is a single index range scan
+    date_posted = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-date_posted', '-post'], name='timeline_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return '%s - %s' %(self.user_id, self.post_id)
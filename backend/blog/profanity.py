@@ -0,0 +1,166 @@
+"""
+Profanity censoring.
+
+The word list is compiled once into an Aho-Corasick automaton, so censoring
+a text is a single pass over it no matter how many words are banned.
+Text is lowercased and leetspeak is folded (`$h1t` -> `shit`) before
+matching, and a `*` may stand in for a vowel (`sh*t`, `f*ck`); matches only
+count on word boundaries and are replaced with `****`, the same output
+better_profanity gives.
+"""
+import itertools
+import os
+from collections import deque
+
+
+CENSOR = '****'
+
+# One character in, one character out, so match offsets line up with the
+# original text
+LEET = str.maketrans({
+    '4': 'a', '@': 'a',
+    '8': 'b',
+    '3': 'e',
+    '6': 'g',
+    '1': 'i', '!': 'i', '|': 'i',
+    '0': 'o',
+    '$': 's', '5': 's',
+    '7': 't', '+': 't',
+})
+
+# Letters a `*` may stand in for, as in better_profanity's character map
+WILDCARD = '*'
+WILDCARD_LETTERS = frozenset('aeiouv')
+
+# Used when better_profanity's word list is not installed
+DEFAULT_WORDS = ['shit', 'shitty', 'asshole', 'bitch', 'bastard']
+
+
+def load_words():
+    """better_profanity's bundled word list, else DEFAULT_WORDS"""
+    try:
+        import better_profanity
+    except ImportError:
+        return list(DEFAULT_WORDS)
+    path = os.path.join(os.path.dirname(better_profanity.__file__), 'profanity_wordlist.txt')
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def normalize(text):
+    """Lowercase and fold leetspeak, keeping the text's length"""
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # A few characters (e.g. 'İ') grow when lowercased
+        lowered = ''.join(ch.lower()[0] for ch in text)
+    return lowered.translate(LEET)
+
+
+def wildcard_spellings(word):
+    """`word` with every combination of its vowels written as WILDCARD"""
+    choices = [(ch, WILDCARD) if ch in WILDCARD_LETTERS else (ch,) for ch in word]
+    return {''.join(spelling) for spelling in itertools.product(*choices)}
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+class ProfanityFilter:
+    """Aho-Corasick automaton over a normalized word list and its wildcard spellings"""
+
+    def __init__(self, words):
+        # Node i: outgoing edges, failure link, lengths of the words ending here
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for word in {normalize(w) for w in words if w}:
+            # The default list grows ~7x this way (about 16k nodes, 4MB)
+            for spelling in wildcard_spellings(word):
+                self._add(spelling)
+        self._build()
+
+    def _add(self, word):
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] += (len(word),)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                # Words ending at the failure state also end here
+                self._out[nxt] += self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def find(self, text):
+        """
+        (start, end) spans of whole-word matches, leftmost-longest and
+        non-overlapping. Word boundaries are checked on the original text so
+        trailing punctuation like '!' isn't read as a leetspeak letter.
+        """
+        norm = normalize(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        best = {}
+        node = 0
+        for i, ch in enumerate(norm):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+            end = i + 1
+            if end < len(text) and _is_word_char(text[end]):
+                continue
+            for length in out[node]:
+                start = end - length
+                if start and _is_word_char(text[start - 1]):
+                    continue
+                if best.get(start, 0) < end:
+                    best[start] = end
+
+        spans = []
+        last_end = 0
+        for start in sorted(best):
+            if start >= last_end:
+                spans.append((start, best[start]))
+                last_end = best[start]
+        return spans
+
+    def contains_profanity(self, text):
+        return bool(text) and bool(self.find(text))
+
+    def censor(self, text):
+        if not text:
+            return ''
+        spans = self.find(text)
+        if not spans:
+            return text
+        parts = []
+        last_end = 0
+        for start, end in spans:
+            parts.append(text[last_end:start])
+            parts.append(CENSOR)
+            last_end = end
+        parts.append(text[last_end:])
+        return ''.join(parts)
+
+
+profanity_filter = ProfanityFilter(load_words())
+
+
+def censor(text):
+    return profanity_filter.censor(text)
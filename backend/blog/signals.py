@@ -0,0 +1,45 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .counters import COUNTED_M2M, adjust, recount
+from .models import Comment, Post
+
+
+""" Keeping like/save counters in step with M2M writes outside the views """
+def m2m_counter_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # pk_set lists what was asked for, not what changed (a remove of a missing
+    # row, or an add that lost an ignore_conflicts race, is still in it), so
+    # the affected rows are recounted instead of moved by len(pk_set)
+    model, field, fk = COUNTED_M2M[sender]
+    if action == 'pre_clear' and reverse:
+        # Reverse side: instance is a User, find what they are about to drop
+        instance._counter_clear_pks = set(
+            sender.objects.filter(user_id=instance.pk).values_list(fk, flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        pks = [instance.pk]
+    elif action == 'post_clear':
+        pks = getattr(instance, '_counter_clear_pks', ())
+    else:
+        pks = pk_set
+    recount(model, field, pks)
+
+
+for through in COUNTED_M2M:
+    m2m_changed.connect(m2m_counter_changed, sender=through)
+
+
+""" Counting top-level comments on their post """
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created and instance.reply_id is None:
+        adjust(Post, [instance.post_id], 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.reply_id is None:
+        adjust(Post, [instance.post_id], 'comments_count', -1)
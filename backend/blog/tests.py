@@ -1,3 +1,175 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
 
-# Create your tests here.
+from blog import comments as comment_threads, counters, profanity
+from blog.models import Comment, Post
+
+
+def make_user(username):
+    return User.objects.create_user(username, f'{username}@example.com', 'pw')
+
+
+def auth(user):
+    return {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=user).key}'}
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.fan = make_user('fan')
+        self.post = Post.objects.create(title='Hello', content='World', author=self.author)
+
+    def _post(self):
+        return Post.objects.get(pk=self.post.pk)
+
+    def test_add_and_remove_related_count_only_real_changes(self):
+        likes = Post.likes.through
+        self.assertTrue(counters.add_related(likes, self.post.id, self.fan.id))
+        self.assertFalse(counters.add_related(likes, self.post.id, self.fan.id))
+        self.assertEqual(self._post().likes_count, 1)
+        self.assertTrue(counters.remove_related(likes, self.post.id, self.fan.id))
+        self.assertFalse(counters.remove_related(likes, self.post.id, self.fan.id))
+        self.assertEqual(self._post().likes_count, 0)
+
+    def test_m2m_writes_keep_counts_exact(self):
+        other = make_user('other')
+        self.post.likes.add(self.fan, other)
+        self.post.likes.add(self.fan)
+        self.assertEqual(self._post().likes_count, 2)
+        # Removing someone who never liked the post changes nothing
+        self.post.likes.remove(make_user('stranger'))
+        self.assertEqual(self._post().likes_count, 2)
+        self.fan.blogpost.clear()
+        self.assertEqual(self._post().likes_count, 1)
+        self.post.likes.clear()
+        self.assertEqual(self._post().likes_count, 0)
+
+    def test_comment_counts_top_level_only(self):
+        comment = Comment.objects.create(post=self.post, name=self.fan, body='first')
+        Comment.objects.create(post=self.post, name=self.author, body='reply', reply=comment)
+        self.assertEqual(self._post().comments_count, 1)
+        comment.delete()
+        self.assertEqual(self._post().comments_count, 0)
+
+    def test_reconcile_repairs_drift(self):
+        self.post.likes.add(self.fan)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7, saves_count=3)
+        self.assertEqual(counters.reconcile(dry_run=True)['Post.likes_count'], 1)
+        self.assertEqual(self._post().likes_count, 7)
+        drifted = counters.reconcile()
+        self.assertEqual(drifted['Post.likes_count'], 1)
+        self.assertEqual(drifted['Post.saves_count'], 1)
+        post = self._post()
+        self.assertEqual((post.likes_count, post.saves_count), (1, 0))
+        self.assertEqual(counters.reconcile(dry_run=True)['Post.likes_count'], 0)
+
+    def test_like_view_toggles(self):
+        headers = auth(self.fan)
+        response = self.client.post('/post/like/', {'id': self.post.id}, **headers)
+        self.assertEqual(response.json()['total_likes'], 1)
+        self.assertTrue(response.json()['liked'])
+        response = self.client.post('/post/like/', {'id': self.post.id}, **headers)
+        self.assertEqual(response.json()['total_likes'], 0)
+        self.assertFalse(response.json()['liked'])
+
+    def test_post_update_writes_only_edited_columns(self):
+        self.post.likes.add(self.fan)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/post/{self.post.pk}/update/', {'title': 'Edited'},
+                content_type='application/json', **auth(self.author)
+            )
+        self.assertEqual(response.status_code, 200)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "blog_post"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('likes_count', updates[0])
+        post = self._post()
+        self.assertEqual((post.title, post.likes_count), ('Edited', 1))
+
+
+class ProfanityTests(TestCase):
+    def test_censors_whole_words_only(self):
+        self.assertEqual(profanity.censor('You shit!'), 'You ****!')
+        self.assertEqual(profanity.censor('Shitty $h1t'), '**** ****')
+        self.assertEqual(profanity.censor('mishit, shitake'), 'mishit, shitake')
+        self.assertEqual(profanity.censor(''), '')
+
+    def test_censors_wildcard_spellings(self):
+        self.assertEqual(profanity.censor('sh*t happens'), '**** happens')
+        self.assertEqual(profanity.censor('b*tch, b*st*rd'), '****, ****')
+        # Only vowels may be starred, and the star must not join two words
+        self.assertEqual(profanity.censor('s*it sh*t*'), 's*it ****')
+
+    def test_matches_overlapping_words_longest_first(self):
+        self.assertEqual(profanity.censor('asshole shitty'), '**** ****')
+
+    def test_matches_better_profanity_on_its_word_list(self):
+        try:
+            from better_profanity import profanity as reference
+        except ImportError:
+            self.skipTest('better_profanity is not installed')
+        reference.load_censor_words()
+        # better_profanity's tokenizer stops at punctuation inside a word
+        # ('s.h.i.t.'), where this filter censors the whole word
+        words = [word for word in profanity.load_words() if word.replace(' ', '').isalnum()]
+        for word in words:
+            starred = [word[:i] + '*' + word[i + 1:] for i, ch in enumerate(word) if ch in 'aeiou']
+            for spelling in [word, word.replace('s', '$').replace('i', '1')] + starred:
+                text = f'well {spelling}, then'
+                self.assertEqual(profanity.censor(text), reference.censor(text), text)
+
+
+class CommentPagingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.post = Post.objects.create(title='Hello', content='World', author=self.author)
+        self.comments = [
+            Comment.objects.create(post=self.post, name=self.author, body=f'comment {i}') for i in range(5)
+        ]
+        self.replies = [
+            Comment.objects.create(post=self.post, name=self.author, body=f'reply {i}', reply=self.comments[0])
+            for i in range(3)
+        ]
+
+    def _walk(self, url, cursor_name, next_name):
+        headers = auth(self.author)
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2, **({cursor_name: cursor} if cursor else {})}
+            page = self.client.get(url, params, **headers).json()
+            seen += [c['id'] for c in page['comments']]
+            cursor = page[next_name]
+            if not page['has_more']:
+                self.assertIsNone(cursor)
+                return seen
+
+    def test_top_level_pages_newest_first_without_replies(self):
+        ids = self._walk(f'/post/{self.post.pk}/comments/', 'before', 'next_before')
+        self.assertEqual(ids, [c.id for c in reversed(self.comments)])
+
+    def test_reply_pages_oldest_first(self):
+        ids = self._walk(f'/comment/{self.comments[0].pk}/replies/', 'after', 'next_after')
+        self.assertEqual(ids, [c.id for c in self.replies])
+
+    def test_comments_carry_reply_counts(self):
+        page, has_more = comment_threads.top_level_comments(self.post.id, limit=10)
+        self.assertFalse(has_more)
+        counts = {c.id: c.replies_count for c in page}
+        self.assertEqual(counts[self.comments[0].id], 3)
+        self.assertEqual(counts[self.comments[1].id], 0)
+
+    def test_new_comment_does_not_shift_pages(self):
+        first, _ = comment_threads.top_level_comments(self.post.id, limit=2)
+        Comment.objects.create(post=self.post, name=self.author, body='late')
+        second, _ = comment_threads.top_level_comments(self.post.id, before=first[-1].id, limit=2)
+        self.assertEqual([c.id for c in second], [self.comments[2].id, self.comments[1].id])
+
+    def test_junk_cursor_is_rejected(self):
+        response = self.client.get(f'/post/{self.post.pk}/comments/', {'before': 'x'}, **auth(self.author))
+        self.assertEqual(response.status_code, 400)
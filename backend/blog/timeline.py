@@ -0,0 +1,115 @@
+"""
+Home timeline.
+
+Posts are pushed into each follower's `TimelineEntry` rows when they are
+created (fan-out on write), so reading a page of the feed is one index range
+scan. Authors with more than FANOUT_FOLLOWER_LIMIT followers are skipped at
+write time; their posts are merged in when the feed is read instead.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q, Subquery
+
+from users.models import Profile
+from .models import Post, TimelineEntry
+
+
+FANOUT_FOLLOWER_LIMIT = 5000
+# Posts copied into a timeline when its owner starts following someone
+BACKFILL_POSTS = 50
+FEED_PAGE_SIZE = 5
+FEED_MAX_PAGE_SIZE = 50
+
+# Profile.following join table: from_profile follows to_profile
+Follow = Profile.following.through
+
+
+def follower_ids(author_id):
+    """User ids of everyone following `author_id`"""
+    return Follow.objects.filter(to_profile__user_id=author_id).values_list('from_profile__user_id', flat=True)
+
+
+def following_ids(user_id):
+    """User ids of everyone `user_id` follows"""
+    return Follow.objects.filter(from_profile__user_id=user_id).values_list('to_profile__user_id', flat=True)
+
+
+def high_follower_author_ids():
+    """Authors whose posts are fanned out on read, refreshed every few minutes"""
+    author_ids = cache.get('timeline:high_follower_authors')
+    if author_ids is None:
+        author_ids = set(
+            Profile.objects.annotate(n_followers=Count('followers'))
+            .filter(n_followers__gt=FANOUT_FOLLOWER_LIMIT)
+            .values_list('user_id', flat=True)
+        )
+        cache.set('timeline:high_follower_authors', author_ids, 300)
+    return author_ids
+
+
+def fan_out_post(post):
+    """Push a new post into its author's and followers' timelines"""
+    recipients = [post.author_id]
+    if post.author_id not in high_follower_author_ids():
+        recipients.extend(follower_ids(post.author_id))
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, date_posted=post.date_posted) for user_id in recipients],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+
+
+def backfill(user_id, author_id, limit=BACKFILL_POSTS):
+    """Copy the author's recent posts into the user's timeline after a follow"""
+    if author_id in high_follower_author_ids():
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by('-date_posted').values_list('id', 'date_posted')[:limit]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, date_posted=date_posted) for post_id, date_posted in posts],
+        ignore_conflicts=True,
+    )
+
+
+def remove_author(user_id, author_id):
+    """Drop the author's posts from the user's timeline after an unfollow"""
+    TimelineEntry.objects.filter(user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    """Recreate a user's timeline from scratch (own posts plus followed authors)"""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    backfill(user_id, user_id)
+    for author_id in following_ids(user_id):
+        backfill(user_id, author_id)
+
+
+def _before(queryset, before, date_field, id_field):
+    """Keyset filter: rows strictly older than post `before` in (date, id) order"""
+    if not before:
+        return queryset
+    anchor_date = Subquery(Post.objects.filter(pk=before).values('date_posted')[:1])
+    return queryset.filter(
+        Q(**{f'{date_field}__lt': anchor_date}) |
+        Q(**{date_field: anchor_date, f'{id_field}__lt': before})
+    )
+
+
+def get_timeline(user_id, before=None, limit=FEED_PAGE_SIZE):
+    """
+    Page of the user's home feed, newest first, starting after post `before`.
+    Returns (posts, has_more).
+    """
+    entries = _before(TimelineEntry.objects.filter(user_id=user_id), before, 'date_posted', 'post_id')
+    rows = list(entries.order_by('-date_posted', '-post_id').values_list('date_posted', 'post_id')[:limit + 1])
+
+    pulled = high_follower_author_ids()
+    if pulled:
+        pulled = pulled.intersection(following_ids(user_id))
+    if pulled:
+        posts = _before(Post.objects.filter(author_id__in=pulled), before, 'date_posted', 'id')
+        rows.extend(posts.order_by('-date_posted', '-id').values_list('date_posted', 'id')[:limit + 1])
+        rows = sorted(set(rows), reverse=True)
+
+    has_more = len(rows) > limit
+    post_ids = [post_id for _, post_id in rows[:limit]]
+    posts = Post.objects.select_related('author__profile').in_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts], has_more
@@ -13,6 +13,8 @@ from .views import (
     LikeCommentView,
     posts_of_following_profiles,
     AllLikeView,
+    post_comments,
+    comment_replies,
 )
 
 urlpatterns = [
@@ -23,6 +25,8 @@ urlpatterns = [
     path('post/<int:pk>/', PostDetailView, name='post-detail'),
     path('post/<int:pk>/update/', post_update, name='post-update'),
     path('post/<int:pk>/delete/', post_delete, name='post-delete'),
+    path('post/<int:pk>/comments/', post_comments, name='post-comments'),
+    path('comment/<int:pk>/replies/', comment_replies, name='comment-replies'),
     path('post/new/', post_create, name='post-create'),
     path('post/like/', LikeView, name='post-like'),
     path('liked-posts/', AllLikeView, name='all-like'),
@@ -1,16 +1,18 @@
 from notification.models import Notification
+from notification import rollup
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth.models import User
 from django.views.decorators.http import require_http_methods
 from .models import Comment, Post
 from .forms import CommentForm
+from . import comments as comment_threads, counters, profanity, timeline
+from search import engine as search_engine
 from django.http import JsonResponse
 from users.models import Profile
-from itertools import chain
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.cache import cache
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-import random
 from django.views.decorators.csrf import csrf_exempt
 import re
 
@@ -22,12 +24,6 @@ try:
 except Exception:
     bleach = None
 
-try:
-    from better_profanity import profanity as better_profanity
-    better_profanity.load_censor_words()
-except Exception:
-    better_profanity = None
-
 
 def _strip_tags(text: str) -> str:
     if not text:
@@ -39,16 +35,7 @@ def _strip_tags(text: str) -> str:
 
 
 def _mask_profanity(text: str) -> str:
-    if not text:
-        return ""
-    if better_profanity:
-        return better_profanity.censor(text)
-    # Minimal fallback list (extend as needed)
-    bad_words = [r"shit", r"shitty", r"asshole", r"bitch", r"bastard"]
-    def repl(m):
-        return m.group(0)[0] + "*" * (len(m.group(0)) - 1)
-    pattern = re.compile(r"\\b(" + "|".join(bad_words) + r")\\b", re.IGNORECASE)
-    return pattern.sub(repl, text)
+    return profanity.censor(text)
 
 
 def _safe_text(text: str, max_len: int = 5000) -> str:
@@ -59,91 +46,145 @@ def _safe_text(text: str, max_len: int = 5000) -> str:
     return txt
 
 
+# Sanitized bodies are cached per (object, version) so read paths don't
+# re-run bleach and the profanity filter on every request
+SAFE_TEXT_CACHE_TTL = 60 * 60 * 24
+
+
+def _cached_safe_texts(kind, items, max_len=5000):
+    """
+    `_safe_text` for many objects at once. `items` are (id, version, text)
+    tuples where version changes whenever the text can have changed.
+    Returns {id: safe text}.
+    """
+    keys = {f'safe_text:{kind}:{obj_id}:{version}:{max_len}': (obj_id, text) for obj_id, version, text in items}
+    cached = cache.get_many(keys)
+    missing = {key: _safe_text(text or "", max_len=max_len) for key, (_, text) in keys.items() if key not in cached}
+    if missing:
+        cache.set_many(missing, SAFE_TEXT_CACHE_TTL)
+    cached.update(missing)
+    return {keys[key][0]: value for key, value in cached.items()}
+
+
 def _serialize_user(u: User):
+    # Uses the profile loaded by select_related('profile') when available
     try:
-        profile = Profile.objects.get(user=u)
+        profile = u.profile
         image = profile.image.url if profile.image else '/media/default.jpg'
     except Profile.DoesNotExist:
         image = '/media/default.jpg'
     return {"id": u.id, "username": u.username, "first_name": u.first_name, "last_name": u.last_name, "image": image}
 
 
-def _serialize_post(p: Post, user=None):
-    liked = False
-    saved = False
-    if user is not None and getattr(user, 'is_authenticated', False):
-        try:
-            liked = p.likes.filter(id=user.id).exists()
-            saved = p.saves.filter(id=user.id).exists()
-        except Exception:
-            liked = False
-            saved = False
-    return {
+def _with_authors(qs):
+    """Post queryset with the author and profile `_serialize_posts` needs"""
+    return qs.select_related('author__profile')
+
+
+def _serialize_posts(posts, user=None):
+    """
+    Serialize a page of posts with a constant number of queries: counts are
+    columns of the post row, authors come from `_with_authors` and the
+    viewer's likes/saves are resolved for the whole page at once.
+    """
+    posts = list(posts)
+
+    contents = _cached_safe_texts('post', [(p.pk, p.date_updated.timestamp(), p.content) for p in posts])
+
+    liked_ids = saved_ids = set()
+    if posts and user is not None and getattr(user, 'is_authenticated', False):
+        post_ids = [p.pk for p in posts]
+        liked_ids = set(Post.likes.through.objects.filter(
+            user_id=user.id, post_id__in=post_ids).values_list('post_id', flat=True))
+        saved_ids = set(Post.saves.through.objects.filter(
+            user_id=user.id, post_id__in=post_ids).values_list('post_id', flat=True))
+
+    return [{
         "id": p.id,
         "title": p.title,
-    "content": _safe_text(p.content or ""),
+        "content": contents[p.id],
         "image": p.image.url if p.image else None,
         "date_posted": p.date_posted.isoformat(),
         "date_updated": p.date_updated.isoformat(),
         "author": _serialize_user(p.author),
-        "likes_count": p.total_likes(),
-        "saves_count": p.total_saves(),
-        "liked": liked,
-        "saved": saved,
-        "comments_count": p.comments.filter(reply=None).count(),
-    }
+        "likes_count": p.likes_count,
+        "saves_count": p.saves_count,
+        "liked": p.id in liked_ids,
+        "saved": p.id in saved_ids,
+        "comments_count": p.comments_count,
+    } for p in posts]
 
 
-def _serialize_comment(c: Comment):
-    return {
+def _serialize_post(p: Post, user=None):
+    return _serialize_posts([p], user)[0]
+
+
+def _serialize_comments(comments, liked_ids=()):
+    comments = list(comments)
+    # Comments can't be edited, so the id alone identifies the text
+    bodies = _cached_safe_texts('comment', [(c.pk, 0, c.body) for c in comments], max_len=2000)
+    return [{
         "id": c.id,
         "post_id": c.post_id,
         "user": _serialize_user(c.name),
-    "body": _safe_text(c.body or "", max_len=2000),
+        "body": bodies[c.id],
         "date_added": c.date_added.isoformat(),
-        "likes_count": c.total_clikes(),
+        "likes_count": c.likes_count,
         "reply_id": c.reply_id,
+        "replies_count": c.replies_count,
+        "liked": c.id in liked_ids,
+    } for c in comments]
+
+
+def _search_page_params(request):
+    """(page, limit) for search results; raises ValueError on junk"""
+    page = max(1, int(request.GET.get('page', 1)))
+    limit = int(request.GET.get('limit', search_engine.SEARCH_PAGE_SIZE))
+    return page, max(1, min(limit, search_engine.SEARCH_MAX_PAGE_SIZE))
+
+
+def _comment_page(comments, user, has_more, cursor_name):
+    """Payload for a page of comments; `cursor_name` carries the next page's cursor"""
+    liked_ids = comment_threads.liked_comment_ids(user, [c.id for c in comments])
+    return {
+        'comments': _serialize_comments(comments, liked_ids),
+        'has_more': has_more,
+        cursor_name: comments[-1].id if comments and has_more else None,
     }
 
 
+def _page_params(request, cursor_name, default_limit):
+    """(cursor, limit) from the query string; raises ValueError on junk"""
+    cursor = int(request.GET.get(cursor_name, 0)) or None
+    limit = int(request.GET.get('limit', default_limit))
+    return cursor, max(1, min(limit, comment_threads.COMMENT_MAX_PAGE_SIZE))
+
+
 @require_http_methods(["GET"])
 def first(request):
-    posts = Post.objects.all().order_by("-date_posted")
+    posts = _with_authors(Post.objects.all()).order_by("-date_posted")
     user = request.user if getattr(request, 'user', None) and request.user.is_authenticated else None
-    return JsonResponse({"posts": [_serialize_post(p, user) for p in posts]}, status=200)
+    return JsonResponse({"posts": _serialize_posts(posts, user)}, status=200)
 
 """ Posts of following user profiles """
 @token_required
 @require_http_methods(["GET"])
 def posts_of_following_profiles(request):
+    """Home feed, newest first; pass the last post id as ?before= for the next page"""
+    try:
+        before = int(request.GET.get('before', 0)) or None
+        limit = int(request.GET.get('limit', timeline.FEED_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+    limit = max(1, min(limit, timeline.FEED_MAX_PAGE_SIZE))
 
-    profile = Profile.objects.get(user = request.user)
-    users = [user for user in profile.following.all()]
-    posts = []
-    qs = None
-    for u in users:
-        p = Profile.objects.get(user=u)
-        p_posts = p.user.post_set.all()
-        posts.append(p_posts)
-    my_posts = profile.profile_posts()
-    posts.append(my_posts)
-    if len(posts)>0:
-        qs = sorted(chain(*posts), reverse=True, key=lambda obj:obj.date_posted)
+    posts, has_more = timeline.get_timeline(request.user.id, before=before, limit=limit)
 
-    paginator = Paginator(qs, 5)
-    page = request.GET.get('page')
-    try:
-        posts_list = paginator.page(page)
-    except PageNotAnInteger:
-        posts_list = paginator.page(1)
-    except EmptyPage:
-        posts_list = paginator.page(paginator.num_pages)
-  
     return JsonResponse({
         'profile': _serialize_user(request.user),
-        'page': posts_list.number,
-        'num_pages': paginator.num_pages,
-        'posts': [_serialize_post(p, request.user) for p in posts_list.object_list],
+        'posts': _serialize_posts(posts, request.user),
+        'has_more': has_more,
+        'next_before': posts[-1].id if posts and has_more else None,
     })
 
 
@@ -154,17 +195,15 @@ def posts_of_following_profiles(request):
 def LikeView(request):
 
     post = get_object_or_404(Post, id=request.POST.get('id'))
-    liked = False
-    if post.likes.filter(id=request.user.id).exists():
-        post.likes.remove(request.user)
+    if counters.remove_related(Post.likes.through, post.id, request.user.id):
         liked = False
-        notify = Notification.objects.filter(post=post, sender=request.user, notification_type=1)
-        notify.delete()
+        rollup.withdraw(post.author_id, request.user.id, 1, post_id=post.id)
     else:
-        post.likes.add(request.user)
         liked = True
-        notify = Notification(post=post, sender=request.user, user=post.author, notification_type=1)
-        notify.save()
+        # A concurrent double tap inserts once and notifies once
+        if counters.add_related(Post.likes.through, post.id, request.user.id):
+            rollup.record(post.author_id, request.user, 1, post_id=post.id)
+    post.refresh_from_db(fields=['likes_count'])
 
     context = {
         'post':post,
@@ -186,14 +225,13 @@ def LikeView(request):
 def SaveView(request):
 
     post = get_object_or_404(Post, id=request.POST.get('id'))
-    saved = False
-    if post.saves.filter(id=request.user.id).exists():
-        post.saves.remove(request.user)
+    if counters.remove_related(Post.saves.through, post.id, request.user.id):
         saved = False
     else:
-        post.saves.add(request.user)
+        counters.add_related(Post.saves.through, post.id, request.user.id)
         saved = True
-    
+    post.refresh_from_db(fields=['saves_count'])
+
     context = {
         'post':post,
         'total_saves':post.total_saves(),
@@ -211,42 +249,22 @@ def SaveView(request):
 @csrf_exempt
 @token_required
 @require_http_methods(["POST"])
-def LikeCommentView(request): # , id1, id2              id1=post.pk id2=reply.pk
-    post = get_object_or_404(Comment, id=request.POST.get('id'))
-    cliked = False
-    if post.likes.filter(id=request.user.id).exists():
-        post.likes.remove(request.user)
+def LikeCommentView(request):
+    comment = get_object_or_404(Comment, id=request.POST.get('id'))
+    if counters.remove_related(Comment.likes.through, comment.id, request.user.id):
         cliked = False
     else:
-        post.likes.add(request.user)
+        counters.add_related(Comment.likes.through, comment.id, request.user.id)
         cliked = True
+    comment.refresh_from_db(fields=['likes_count'])
 
-    cpost = get_object_or_404(Post, id=request.POST.get('pid'))
-    total_comments2 = cpost.comments.all().order_by('-id')
-    total_comments = cpost.comments.all().filter(reply=None).order_by('-id')
-    tcl={}
-    for cmt in total_comments2:
-        total_clikes = cmt.total_clikes()
-        cliked = False
-        if cmt.likes.filter(id=request.user.id).exists():
-            cliked = True
-
-        tcl[cmt.id] = cliked
-
-
-    context = {
-        'comment_form':CommentForm(),
-        'post':cpost,
-        'comments':total_comments,
-        'total_clikes':post.total_clikes(),
-        'clikes':tcl
-    }
-
+    # Only the toggled comment changed; clients keep the rest of the thread
     return JsonResponse({
-        'comment_id': post.id,
-        'post_id': cpost.id,
-        'total_clikes': post.total_clikes(),
-        'clikes': tcl,
+        'comment_id': comment.id,
+        'post_id': comment.post_id,
+        'total_clikes': comment.likes_count,
+        'liked': cliked,
+        'clikes': {comment.id: cliked},
     })
 
 
@@ -254,7 +272,7 @@ def LikeCommentView(request): # , id1, id2              id1=post.pk id2=reply.pk
 @token_required
 @require_http_methods(["GET"])
 def post_list(request):
-    qs = Post.objects.all().order_by('-date_posted')
+    qs = _with_authors(Post.objects.all()).order_by('-date_posted')
     paginator = Paginator(qs, 5)
     page = request.GET.get('page')
     try:
@@ -265,14 +283,12 @@ def post_list(request):
         posts_list = paginator.page(paginator.num_pages)
 
     # suggest up to 3 random users to follow (excluding self)
-    users = list(User.objects.exclude(pk=request.user.pk))
-    cnt = min(3, len(users))
-    random_users = random.sample(users, cnt) if cnt else []
+    random_users = User.objects.exclude(pk=request.user.pk).select_related('profile').order_by('?')[:3]
 
     return JsonResponse({
         'page': posts_list.number,
         'num_pages': paginator.num_pages,
-        'posts': [_serialize_post(p, request.user) for p in posts_list.object_list],
+        'posts': _serialize_posts(posts_list.object_list, request.user),
         'suggested_users': [_serialize_user(u) for u in random_users],
     })
 
@@ -282,7 +298,7 @@ def post_list(request):
 @require_http_methods(["GET"])
 def user_posts(request, username):
     user = get_object_or_404(User, username=username)
-    qs = Post.objects.filter(author=user).order_by('-date_posted')
+    qs = _with_authors(Post.objects.filter(author=user)).order_by('-date_posted')
     paginator = Paginator(qs, 5)
     page = request.GET.get('page')
     try:
@@ -295,7 +311,7 @@ def user_posts(request, username):
         'author': _serialize_user(user),
         'page': posts_list.number,
         'num_pages': paginator.num_pages,
-        'posts': [_serialize_post(p, request.user) for p in posts_list.object_list],
+        'posts': _serialize_posts(posts_list.object_list, request.user),
     })
 
 
@@ -307,12 +323,6 @@ def user_posts(request, username):
 def PostDetailView(request,pk):
 
     stuff = get_object_or_404(Post, id=pk)
-    total_likes = stuff.total_likes()
-    total_saves = stuff.total_saves()
-    total_comments = stuff.comments.all().filter(reply=None).order_by('-id')
-    total_comments2 = stuff.comments.all().order_by('-id')
-
-    context = {}
 
     if request.method == "POST":
         comment_qs = None
@@ -324,60 +334,61 @@ def PostDetailView(request,pk):
                 comment_qs = Comment.objects.get(id=reply_id)
             
             safe_form = _safe_text(form, max_len=2000)
-            comment = Comment.objects.create(name=request.user,post=stuff,body=safe_form, reply=comment_qs)
-            comment.save()
+            Comment.objects.create(name=request.user,post=stuff,body=safe_form, reply=comment_qs)
             if reply_id:
-                notify = Notification(post=stuff, sender=request.user, user=stuff.author, text_preview=form, notification_type=4)
+                notify = Notification(post=stuff, sender=request.user, user=stuff.author, text_preview=safe_form[:120], notification_type=4)
                 notify.save()
             else:
-                notify = Notification(post=stuff, sender=request.user, user=stuff.author, text_preview=form, notification_type=3)
+                notify = Notification(post=stuff, sender=request.user, user=stuff.author, text_preview=safe_form[:120], notification_type=3)
                 notify.save()
-            total_comments = stuff.comments.all().filter(reply=None).order_by('-id')
-            total_comments2 = stuff.comments.all().order_by('-id')
-    else:
-        comment_form = CommentForm()
-             
-
-    tcl={}
-    for cmt in total_comments2:
-        total_clikes = cmt.total_clikes()
-        cliked = False
-        if cmt.likes.filter(id=request.user.id).exists():
-            cliked = True
+            stuff.refresh_from_db(fields=['comments_count'])
 
-        tcl[cmt.id] = cliked
-    context["clikes"]=tcl
+    comments, has_more = comment_threads.top_level_comments(stuff.id)
+    page = _comment_page(comments, request.user, has_more, 'next_before')
+    post = _serialize_post(stuff, request.user)
 
+    # return full JSON detail; further comment pages come from post-comments
+    return JsonResponse({
+        'post': post,
+        'total_likes': post['likes_count'],
+        'liked': post['liked'],
+        'total_saves': post['saves_count'],
+        'saved': post['saved'],
+        'comments': page['comments'],
+        'comments_has_more': page['has_more'],
+        'comments_next_before': page['next_before'],
+        'clikes': {c['id']: c['liked'] for c in page['comments']},
+    })
 
-    liked = False
-    if stuff.likes.filter(id=request.user.id).exists():
-        liked = True
-    context["total_likes"]=total_likes
-    context["liked"]=liked
 
+""" Top-level comments of a post, newest first """
+@token_required
+@require_http_methods(["GET"])
+def post_comments(request, pk):
+    """Pass the last comment id as ?before= for the next page"""
+    post = get_object_or_404(Post, id=pk)
+    try:
+        before, limit = _page_params(request, 'before', comment_threads.COMMENT_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
 
-    saved = False
-    if stuff.saves.filter(id=request.user.id).exists():
-        saved = True
-    context["total_saves"]=total_saves
-    context["saved"]=saved
-    
+    comments, has_more = comment_threads.top_level_comments(post.id, before=before, limit=limit)
+    return JsonResponse(_comment_page(comments, request.user, has_more, 'next_before'))
 
-    context['comment_form'] = comment_form
 
-    context['post']=stuff
-    context['comments']=total_comments
+""" Replies to a comment, oldest first """
+@token_required
+@require_http_methods(["GET"])
+def comment_replies(request, pk):
+    """Pass the last reply id as ?after= for the next page"""
+    comment = get_object_or_404(Comment, id=pk)
+    try:
+        after, limit = _page_params(request, 'after', comment_threads.REPLY_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
 
-    # return full JSON detail
-    return JsonResponse({
-        'post': _serialize_post(stuff, request.user),
-        'total_likes': context["total_likes"],
-        'liked': context["liked"],
-        'total_saves': context["total_saves"],
-        'saved': context["saved"],
-        'comments': [_serialize_comment(c) for c in total_comments],
-        'clikes': context["clikes"],
-    })
+    replies, has_more = comment_threads.replies(comment, after=after, limit=limit)
+    return JsonResponse(_comment_page(replies, request.user, has_more, 'next_after'))
 
 
 """ Create post """
@@ -401,7 +412,9 @@ def post_create(request):
     # Handle image upload if provided
     if image:
         post.image = image
-        post.save()
+        post.save(update_fields=['image'])
+
+    timeline.fan_out_post(post)
 
     return JsonResponse({'post': _serialize_post(post, request.user)}, status=201)
 
@@ -424,11 +437,15 @@ def post_update(request, pk):
     else:
         title = request.POST.get('title')
         content = request.POST.get('content')
+    # Only the edited columns, so counters bumped meanwhile aren't written back
+    update_fields = ['date_updated']
     if title is not None:
         post.title = _safe_text(title, max_len=200)
+        update_fields.append('title')
     if content is not None:
         post.content = _safe_text(content)
-    post.save()
+        update_fields.append('content')
+    post.save(update_fields=update_fields)
     return JsonResponse({'post': _serialize_post(post, request.user)})
 
 
@@ -450,21 +467,21 @@ def about(request):
     return JsonResponse({'name': 'Django Social API', 'version': '1.0'})
 
 
-""" Search by post title or username """
+""" Search posts by title, content or author """
 @require_http_methods(["GET"])
 def search(request):
-    query = request.GET['query']
-    if len(query) >= 150 or len(query) < 1:
-        allposts = Post.objects.none()
-    elif len(query.strip()) == 0:
-        allposts = Post.objects.none()
-    else:
-        allpostsTitle = Post.objects.filter(title__icontains=query)
-        allpostsAuthor = Post.objects.filter(author__username = query)
-        allposts = allpostsAuthor.union(allpostsTitle)
-    
+    query = request.GET.get('query', '')
+    try:
+        page, limit = _search_page_params(request)
+    except ValueError:
+        return JsonResponse({'error': 'invalid page'}, status=400)
+
+    post_ids, has_more = search_engine.search_posts(query[:150], page=page, limit=limit)
+    posts = _with_authors(Post.objects.all()).in_bulk(post_ids)
+    ranked = [posts[post_id] for post_id in post_ids if post_id in posts]
+
     user = request.user if getattr(request, 'user', None) and request.user.is_authenticated else None
-    return JsonResponse({'results': [_serialize_post(p, user) for p in allposts]})
+    return JsonResponse({'results': _serialize_posts(ranked, user), 'page': page, 'has_more': has_more})
 
 
 """ Liked posts """
@@ -472,11 +489,11 @@ def search(request):
 @require_http_methods(["GET"])
 def AllLikeView(request):
     user = request.user
-    liked_posts = user.blogpost.all()
+    liked_posts = _with_authors(user.blogpost.all())
     context = {
         'liked_posts':liked_posts
     }
-    return JsonResponse({'liked_posts': [_serialize_post(p, request.user) for p in liked_posts]})
+    return JsonResponse({'liked_posts': _serialize_posts(liked_posts, request.user)})
 
 
 """ Saved posts """
@@ -484,9 +501,9 @@ def AllLikeView(request):
 @require_http_methods(["GET"])
 def AllSaveView(request):
     user = request.user
-    saved_posts = user.blogsave.all()
+    saved_posts = _with_authors(user.blogsave.all())
     context = {
         'saved_posts':saved_posts
     }
-    return JsonResponse({'saved_posts': [_serialize_post(p, request.user) for p in saved_posts]})
+    return JsonResponse({'saved_posts': _serialize_posts(saved_posts, request.user)})
 
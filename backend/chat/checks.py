@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core import checks
+
+
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+IN_MEMORY_LAYER = 'channels.layers.InMemoryChannelLayer'
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """A cross-process channel layer means several workers, which must share one cache"""
+    layer = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND')
+    if layer in (None, IN_MEMORY_LAYER):
+        return []
+    return [
+        checks.Warning(
+            f"The '{alias}' cache is local memory but the channel layer ({layer}) is shared across processes.",
+            hint='Set CACHE_REDIS_URL so presence, friend lists and the autocomplete index agree across workers.',
+            id='chat.W001',
+        )
+        for alias, config in settings.CACHES.items()
+        if config.get('BACKEND') == LOCMEM_CACHE
+    ]
@@ -1,66 +1,146 @@
-from chat.models import Chat, Room
+from chat.models import MESSAGE_MAX_LENGTH, Chat, Room
+from chat.persistence import message_buffer
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.contrib.auth.models import User
-from asgiref.sync import sync_to_async, async_to_sync
-from users.models import Profile
+from channels.db import database_sync_to_async
+from chat.presence_events import presence_fanout
+from blog.profanity import censor
+from users import presence
+from notification.realtime import notification_group
+import asyncio
 
 
-"""MESSAGE DB ENTRY"""
-@sync_to_async
-def create_new_message(me,friend,message,room_id):
-    get_room = Room.objects.filter(room_id=room_id)[0]
-    author_user = User.objects.filter(username=me)[0]
-    friend_user = User.objects.filter(username=friend)[0]
-    new_chat = Chat.objects.create(
-        author=author_user,
-        friend=friend_user,
-        room_id=get_room,
-        text=message)
+"""ROOM MEMBERS"""
+@database_sync_to_async
+def get_room_members(room_id):
+    if not str(room_id).isdigit():
+        return None
+    return Room.objects.filter(room_id=room_id).values_list('author_id', 'friend_id').first()
 
 
 class OnlineStatusConsumer(AsyncWebsocketConsumer):
-    """Consumer for real-time online status updates"""
+    """Consumer for real-time online status updates of the user's friends"""
 
     async def connect(self):
         self.user = self.scope['user']
         if self.user.is_authenticated:
-            await self.set_online_status(True)
+            self.presence_group = presence.presence_group(self.user.id)
+            came_online = await database_sync_to_async(presence.connect)(self.user.id)
+            if came_online:
+                presence_fanout.publish(self.user.id, True)
             await self.channel_layer.group_add(
-                'online_status',
+                self.presence_group,
                 self.channel_name
             )
             await self.accept()
 
     async def disconnect(self, close_code):
         if hasattr(self, 'user') and self.user.is_authenticated:
-            await self.set_online_status(False)
-        await self.channel_layer.group_discard(
-            'online_status',
-            self.channel_name
-        )
+            last_socket = await database_sync_to_async(presence.disconnect)(self.user.id)
+            if last_socket:
+                asyncio.ensure_future(self.settle_offline(self.user.id))
+            await self.channel_layer.group_discard(
+                self.presence_group,
+                self.channel_name
+            )
 
-    @sync_to_async
-    def set_online_status(self, is_online):
-        try:
-            profile = Profile.objects.get(user=self.user)
-            profile.is_online = is_online
-            profile.save()
-        except Profile.DoesNotExist:
-            pass
+    async def settle_offline(self, user_id):
+        # Give reconnecting clients (page reloads, network blips) a moment
+        await asyncio.sleep(presence.OFFLINE_GRACE)
+        went_offline = await database_sync_to_async(presence.settle_offline)(user_id)
+        if went_offline:
+            presence_fanout.publish(user_id, False)
 
     async def receive(self, text_data):
-        # Handle any client messages if needed
-        pass
-
-    async def user_online(self, event):
-        """Send online status update to WebSocket"""
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            return
+        if data.get('type') == 'heartbeat':
+            came_online = await database_sync_to_async(presence.heartbeat)(self.user.id)
+            if came_online:
+                presence_fanout.publish(self.user.id, True)
+
+    async def presence_delta(self, event):
+        """Send a batch of friends' online status changes to WebSocket"""
         await self.send(text_data=json.dumps({
-            'type': 'user_online',
-            'user_id': event['user_id'],
-            'is_online': event['is_online']
+            'type': 'presence',
+            'changes': {str(user_id): is_online for user_id, is_online in event['changes'].items()},
         }))
-        
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes the user's new notifications. Notifications arriving within
+    COALESCE_WINDOW seconds of each other are grouped by (type, post), so a
+    burst of likes on one post becomes a single "N people liked" frame.
+    """
+
+    COALESCE_WINDOW = 1.0
+    SENDER_SAMPLE = 3
+
+    async def connect(self):
+        self.user = self.scope['user']
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        self.notification_group = notification_group(self.user.id)
+        self.pending = []
+        self.unread_count = None
+        self.flush_task = None
+        await self.channel_layer.group_add(
+            self.notification_group,
+            self.channel_name
+        )
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'notification_group'):
+            if self.flush_task is not None:
+                self.flush_task.cancel()
+            await self.channel_layer.group_discard(
+                self.notification_group,
+                self.channel_name
+            )
+
+    async def notification_event(self, event):
+        self.pending.append(event['notification'])
+        self.unread_count = event.get('unread_count', self.unread_count)
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.COALESCE_WINDOW)
+        pending, self.pending = self.pending, []
+
+        groups = {}
+        for notification in pending:
+            groups.setdefault((notification['notification_type'], notification['post_id']), []).append(notification)
+
+        for (notification_type, post_id), events in groups.items():
+            # A rollup updated several times in the window: keep its latest state
+            notifications = list({n['id']: n for n in events}.values())
+            notifications.sort(key=lambda n: n['date'])
+            if len(notifications) == 1:
+                frame = {'type': 'notification', 'notification': notifications[0]}
+            else:
+                senders = []
+                for n in reversed(notifications):
+                    for sender in [n['sender'], *n.get('actors', ())]:
+                        if sender not in senders:
+                            senders.append(sender)
+                frame = {
+                    'type': 'notification_group',
+                    'notification_type': notification_type,
+                    'post_id': post_id,
+                    'count': sum(n.get('actor_count', 1) for n in notifications),
+                    'senders': senders[:self.SENDER_SAMPLE],
+                    'notification_ids': [n['id'] for n in notifications],
+                    'latest': notifications[-1],
+                }
+            frame['unread_count'] = self.unread_count
+            await self.send(text_data=json.dumps(frame))
+
 
 class ChatRoomConsumer(AsyncWebsocketConsumer):
 
@@ -68,6 +148,15 @@ class ChatRoomConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = 'chat_%s' % self.room_name
+        self.user = self.scope['user']
+
+        # Resolve the recipient once per connection; messages are only
+        # persisted for authenticated members of the room
+        self.friend_id = None
+        members = await get_room_members(self.room_name)
+        if members and self.user.is_authenticated and self.user.id in members:
+            author_id, friend_id = members
+            self.friend_id = friend_id if author_id == self.user.id else author_id
 
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -82,14 +171,19 @@ class ChatRoomConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        await message_buffer.flush()
 
     """Receive"""
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
-        message = text_data_json['message']
+        # Trimmed before broadcast so everyone sees what history will hold
+        message = censor(text_data_json['message'])[:MESSAGE_MAX_LENGTH]
         username = text_data_json['username']
         user_image = text_data_json['user_image']
 
+        # Persist once on the sending side, not in every receiving consumer
+        await self.save_message(message)
+
         await self.channel_layer.group_send(
             self.room_group_name,
             {
@@ -100,7 +194,16 @@ class ChatRoomConsumer(AsyncWebsocketConsumer):
             }
         )
 
-
+    """Persist"""
+    async def save_message(self, message):
+        if self.friend_id is None:
+            return
+        await message_buffer.add(Chat(
+            room_id_id=self.room_name,
+            author_id=self.user.id,
+            friend_id=self.friend_id,
+            text=message,
+        ))
 
     """Messages"""
     async def chatroom_message(self, event):
@@ -108,11 +211,20 @@ class ChatRoomConsumer(AsyncWebsocketConsumer):
         username = event['username']
         user_image = event['user_image']
 
-        await create_new_message(me=self.scope["user"], friend=username, message=message, room_id=self.room_name)
-        
         await self.send(text_data=json.dumps({
             'message': message,
             'username': username,
             'user_image': user_image,
         }))
 
+    """Receipts"""
+    async def chat_receipt(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'receipt',
+            'status': event['status'],
+            'reader_id': event['reader_id'],
+            'reader': event['reader'],
+            'up_to_id': event['up_to_id'],
+            'count': event['count'],
+            'at': event['at'],
+        }))
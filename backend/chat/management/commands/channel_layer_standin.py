@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    import fakeredis
+except Exception:
+    fakeredis = None
+
+
+class Command(BaseCommand):
+    help = 'Run a local Redis-protocol stand-in (fakeredis) for the Redis channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=6379)
+
+    def handle(self, *args, **options):
+        if fakeredis is None or not hasattr(fakeredis, 'TcpFakeServer'):
+            raise CommandError('fakeredis>=2.23 (plus lupa for the redis backend) is required: pip install fakeredis lupa')
+
+        server = fakeredis.TcpFakeServer((options['host'], options['port']), server_type='redis')
+        self.stdout.write(f"Redis stand-in listening on redis://{options['host']}:{options['port']}/0")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,32 @@
+import asyncio
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Send a message through a group on the configured channel layer and wait for it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        backend = settings.CHANNEL_LAYERS['default']['BACKEND']
+        try:
+            asyncio.run(self.round_trip(options['timeout']))
+        except asyncio.TimeoutError:
+            raise CommandError(f'No message received through {backend} within {options["timeout"]}s')
+        self.stdout.write(self.style.SUCCESS(f'Group round trip OK through {backend}'))
+
+    async def round_trip(self, timeout):
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add('layer_check', channel_name)
+        try:
+            await channel_layer.group_send('layer_check', {'type': 'layer.check'})
+            message = await asyncio.wait_for(channel_layer.receive(channel_name), timeout)
+            if message.get('type') != 'layer.check':
+                raise CommandError(f'Unexpected message: {message}')
+        finally:
+            await channel_layer.group_discard('layer_check', channel_name)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_rename_has_seen_chat_is_deleted_chat_deleted_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['room_id', 'date', 'id'], name='chat_room_date_id_idx'),
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
 
+
+MESSAGE_MAX_LENGTH = 300
 # Create your models here.
 
 class Room(models.Model):
@@ -26,7 +28,7 @@ class Chat(models.Model):
     room_id = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='chats')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='author_msg')
     friend = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friend_msg')
-    text = models.CharField(max_length=300)
+    text = models.CharField(max_length=MESSAGE_MAX_LENGTH)
     date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='sent')
     delivered_at = models.DateTimeField(null=True, blank=True)
@@ -35,6 +37,12 @@ class Chat(models.Model):
     deleted_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='deleted_messages')
     deleted_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of room history walks (room, date, id)
+            models.Index(fields=['room_id', 'date', 'id'], name='chat_room_date_id_idx'),
+        ]
+
     def __str__(self):
         return '%s - %s' %(self.id, self.date)
 
@@ -43,14 +51,14 @@ class Chat(models.Model):
         if self.status == 'sent':
             self.status = 'delivered'
             self.delivered_at = timezone.now()
-            self.save()
+            self.save(update_fields=['status', 'delivered_at'])
 
     def mark_as_read(self):
         """Mark message as read"""
         if self.status in ['sent', 'delivered']:
             self.status = 'read'
             self.read_at = timezone.now()
-            self.save()
+            self.save(update_fields=['status', 'read_at'])
 
     def delete_message(self, deleted_by_user):
         """Soft delete the message"""
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.db import transaction
+
+from chat.models import Chat
+
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBuffer:
+    """
+    Write-behind buffer for chat messages.
+
+    Consumers hand over unsaved `Chat` instances and the buffer inserts them
+    with one `bulk_create` per batch, flushed when `max_batch` messages are
+    pending or `flush_interval` seconds after the first one arrived,
+    whichever comes first. If the batch insert fails, rows are retried one
+    at a time so a single bad message doesn't take the rest of the batch
+    (often several rooms' worth, already broadcast) down with it.
+    """
+
+    def __init__(self, max_batch=50, flush_interval=0.25):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._flush_task = None
+
+    async def add(self, chat):
+        self._pending.append(chat)
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        await database_sync_to_async(_persist)(batch)
+
+
+def _persist(batch):
+    try:
+        with transaction.atomic():
+            Chat.objects.bulk_create(batch)
+        return
+    except Exception as e:
+        logger.warning(f'Batch insert of {len(batch)} chat messages failed, retrying one by one: {str(e)}')
+
+    for chat in batch:
+        chat.pk = None
+        try:
+            with transaction.atomic():
+                chat.save(force_insert=True)
+        except Exception as e:
+            logger.error(f'Failed to persist chat message in room {chat.room_id_id}: {str(e)}')
+
+
+message_buffer = MessageBuffer()
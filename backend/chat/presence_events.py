@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+
+from users import presence
+
+
+logger = logging.getLogger(__name__)
+
+
+async def send_presence_deltas(changes):
+    """
+    Fan `{user_id: is_online}` changes out to the affected users' friends,
+    one `presence_delta` frame per friend group.
+    """
+    audience = await database_sync_to_async(presence.audience)(list(changes))
+
+    deltas = {}
+    for user_id, is_online in changes.items():
+        for friend_id in audience.get(user_id, ()):
+            deltas.setdefault(friend_id, {})[user_id] = is_online
+
+    channel_layer = get_channel_layer()
+    for friend_id, delta in deltas.items():
+        await channel_layer.group_send(
+            presence.presence_group(friend_id),
+            {'type': 'presence_delta', 'changes': delta}
+        )
+
+
+def publish_presence(user_id, is_online):
+    """Send one transition right away, for synchronous callers (HTTP views)"""
+    try:
+        async_to_sync(send_presence_deltas)({user_id: is_online})
+    except Exception as e:
+        logger.warning(f'Could not publish presence for user {user_id}: {str(e)}')
+
+
+class PresenceFanout:
+    """
+    Collects presence transitions from consumers and flushes them every
+    `interval` seconds. A user who flaps several times inside one interval
+    only produces their latest state.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._changes = {}
+        self._flush_task = None
+
+    def publish(self, user_id, is_online):
+        self._changes[user_id] = is_online
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        changes, self._changes = self._changes, {}
+        if not changes:
+            return
+        try:
+            await send_presence_deltas(changes)
+        except Exception as e:
+            logger.warning(f'Could not publish presence for {len(changes)} users: {str(e)}')
+
+
+presence_fanout = PresenceFanout()
@@ -1,3 +1,106 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
 
-# Create your tests here.
+from chat.checks import check_shared_cache
+from chat.models import Chat, Room
+from chat.persistence import MessageBuffer
+from chat.views import get_chat_history
+
+
+class MessageBufferTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.room = Room.objects.create(author=self.alice, friend=self.bob)
+
+    def _chat(self, text):
+        return Chat(room_id=self.room, author=self.alice, friend=self.bob, text=text)
+
+    def test_flush_inserts_batch(self):
+        buffer = MessageBuffer(max_batch=10, flush_interval=60)
+        for i in range(3):
+            async_to_sync(buffer.add)(self._chat(f'hi {i}'))
+        self.assertEqual(Chat.objects.count(), 0)
+        async_to_sync(buffer.flush)()
+        self.assertEqual(list(Chat.objects.order_by('id').values_list('text', flat=True)), ['hi 0', 'hi 1', 'hi 2'])
+
+    def test_bad_row_does_not_lose_the_rest_of_the_batch(self):
+        buffer = MessageBuffer(max_batch=10, flush_interval=60)
+        for text in ('first', None, 'third'):
+            async_to_sync(buffer.add)(self._chat(text))
+        with self.assertLogs('chat.persistence', level='WARNING'):
+            async_to_sync(buffer.flush)()
+        self.assertEqual(sorted(Chat.objects.values_list('text', flat=True)), ['first', 'third'])
+
+
+REDIS_LAYER = {'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}}
+REDIS_CACHE = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'}
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_in_memory_layer_needs_no_shared_cache(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(CHANNEL_LAYERS=REDIS_LAYER)
+    def test_redis_layer_with_local_cache_warns(self):
+        warnings = check_shared_cache(None)
+        self.assertEqual([w.id for w in warnings], ['chat.W001', 'chat.W001'])
+
+    @override_settings(CHANNEL_LAYERS=REDIS_LAYER, CACHES={'default': REDIS_CACHE, 'presence': REDIS_CACHE})
+    def test_redis_layer_with_redis_cache_is_fine(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.room = Room.objects.create(author=self.alice, friend=self.bob)
+        self.chats = [
+            Chat.objects.create(room_id=self.room, author=self.alice, friend=self.bob, text=f'msg {i}')
+            for i in range(7)
+        ]
+        # Messages sharing a timestamp are ordered by id
+        Chat.objects.filter(pk__in=[c.pk for c in self.chats[2:5]]).update(date=self.chats[2].date)
+        self.ids = list(Chat.objects.order_by('date', 'id').values_list('id', flat=True))
+
+    def _ids(self, chats):
+        return [c.id for c in chats]
+
+    def test_latest_page_in_chronological_order(self):
+        page, has_more = get_chat_history(self.room.room_id, limit=3)
+        self.assertEqual(self._ids(page), self.ids[-3:])
+        self.assertTrue(has_more)
+
+    def test_scrolling_back_and_forward_covers_every_message_once(self):
+        page, has_more = get_chat_history(self.room.room_id, limit=2)
+        older = self._ids(page)
+        while has_more:
+            page, has_more = get_chat_history(self.room.room_id, before=page[0].id, limit=2)
+            older = self._ids(page) + older
+        self.assertEqual(older, self.ids)
+
+        page, has_more = get_chat_history(self.room.room_id, after=self.ids[0], limit=4)
+        self.assertEqual(self._ids(page), self.ids[1:5])
+        self.assertTrue(has_more)
+        page, has_more = get_chat_history(self.room.room_id, after=page[-1].id, limit=4)
+        self.assertEqual((self._ids(page), has_more), (self.ids[5:], False))
+
+    def test_deleted_messages_are_skipped(self):
+        Chat.objects.filter(pk=self.ids[-1]).update(is_deleted=True)
+        page, _ = get_chat_history(self.room.room_id, limit=2)
+        self.assertEqual(self._ids(page), self.ids[-3:-1])
+
+    def test_history_view_is_members_only(self):
+        carol = User.objects.create_user('carol', 'carol@example.com', 'pw')
+        url = f'/chats/history/{self.room.room_id}'
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=carol).key}')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            url, {'limit': 3}, HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.bob).key}'
+        )
+        body = response.json()
+        self.assertEqual([m['id'] for m in body['messages']], self.ids[-3:])
+        self.assertEqual((body['before'], body['after']), (self.ids[-3], self.ids[-1]))
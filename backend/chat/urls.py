@@ -5,6 +5,7 @@ urlpatterns = [
     path('', views.room_enroll, name='room-enroll'),
     path('chat/<int:friend_id>', views.room_choice, name='room-choice'),
     path('room/<int:room_name>-<int:friend_id>', views.room, name='room'),
+    path('history/<int:room_name>', views.chat_history, name='chat-history'),
     path('send/<int:room_name>', views.send_message, name='send-message'),
     path('mark-delivered/<int:room_name>', views.mark_messages_delivered, name='mark-delivered'),
     path('mark-read/<int:room_name>', views.mark_messages_read, name='mark-read'),
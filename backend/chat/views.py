@@ -1,19 +1,28 @@
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Room, Chat
-from django.db.models import Q
+from .models import MESSAGE_MAX_LENGTH, Room, Chat
+from django.db.models import Q, Max, Subquery
 from friend.models import FriendList
+from friend import graph as friend_graph
+from blog.profanity import censor
 from django.contrib.auth.models import User
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from django.utils import timezone
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
 import json
+import logging
 
 # Import token authentication decorator
 from users.views import token_required
 
 
+logger = logging.getLogger(__name__)
+
+
 @token_required
 @require_http_methods(["GET"])
 def room_enroll(request):
@@ -49,7 +58,7 @@ def room_choice(request, friend_id):
     if not friend:
         messages.error(request, 'Invalid User ID')
         return redirect('room-enroll') 
-    if not FriendList.objects.filter(user=request.user, friends=friend[0]):
+    if not friend_graph.are_friends(request.user.id, friend[0].id):
         messages.error(request, 'You need to be friends to chat')
         return redirect('room-enroll') 
 
@@ -65,38 +74,122 @@ def room_choice(request, friend_id):
     return JsonResponse({'room_id': room[0].room_id, 'friend_id': friend_id})
 
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def _serialize_chat(c):
+    return {
+        'id': c.id,
+        'user': c.author.username,
+        'message': c.text,
+        'date': c.date.isoformat(),
+        'status': c.status,
+        'delivered_at': c.delivered_at.isoformat() if c.delivered_at else None,
+        'read_at': c.read_at.isoformat() if c.read_at else None,
+        'is_deleted': c.is_deleted,
+    }
+
+
+def _parse_cursor(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def get_chat_history(room_id, before=None, after=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Keyset page of a room's messages in chronological order.
+
+    `before`/`after` are message ids; the anchor's (date, id) is resolved
+    in a subquery so each page is a single bounded query on the
+    (room_id, date, id) index. Without a cursor the latest page is returned.
+    Returns (messages, has_more).
+    """
+    chats = Chat.objects.filter(room_id=room_id, is_deleted=False).select_related('author')
+    anchor_id = after or before
+    if anchor_id:
+        anchor_date = Subquery(Chat.objects.filter(pk=anchor_id, room_id=room_id).values('date')[:1])
+        if after:
+            chats = chats.filter(Q(date__gt=anchor_date) | Q(date=anchor_date, id__gt=anchor_id))
+        else:
+            chats = chats.filter(Q(date__lt=anchor_date) | Q(date=anchor_date, id__lt=anchor_id))
+
+    if after:
+        page = list(chats.order_by('date', 'id')[:limit + 1])
+        has_more = len(page) > limit
+        return page[:limit], has_more
+
+    page = list(chats.order_by('-date', '-id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    return page, has_more
+
+
+def _history_page(request, room_id):
+    """Read cursor params from the query string and build the paged payload"""
+    before = _parse_cursor(request.GET.get('before'))
+    after = _parse_cursor(request.GET.get('after'))
+    limit = _parse_cursor(request.GET.get('limit')) or HISTORY_PAGE_SIZE
+    limit = min(limit, HISTORY_MAX_PAGE_SIZE)
+
+    chats, has_more = get_chat_history(room_id, before=before, after=after, limit=limit)
+    return {
+        'messages': [_serialize_chat(c) for c in chats],
+        'has_more': has_more,
+        # Cursors for the next page in each direction
+        'before': chats[0].id if chats else before,
+        'after': chats[-1].id if chats else after,
+    }
+
+
 """ Chatroom between users """
 @token_required
 @require_http_methods(["GET"])
 def room(request, room_name, friend_id):
-    all_rooms = Room.objects.filter(room_id=room_name)
-    if not all_rooms:  
+    chat_room = Room.objects.select_related('author', 'friend').filter(room_id=room_name).first()
+    if not chat_room:
         messages.error(request, 'Invalid Room ID')
         return redirect('room-enroll')
 
-    chats = Chat.objects.filter(
-        room_id=room_name
-    ).order_by('date')
+    if friend_id == chat_room.author_id:
+        friend_username = chat_room.author.username
+    elif friend_id == chat_room.friend_id:
+        friend_username = chat_room.friend.username
+    else:
+        friend_username = User.objects.get(pk=friend_id).username
+
+    history = _history_page(request, room_name)
 
     return JsonResponse({
         'room_name': room_name,
-        'friend': {'id': friend_id, 'username': User.objects.get(pk=friend_id).username},
+        'friend': {'id': friend_id, 'username': friend_username},
         'me': {'id': request.user.id, 'username': request.user.username},
-        'old_chats': [
-            {
-                'id': c.id,
-                'user': c.author.username,
-                'message': c.text,
-                'date': c.date.isoformat(),
-                'status': c.status,
-                'delivered_at': c.delivered_at.isoformat() if c.delivered_at else None,
-                'read_at': c.read_at.isoformat() if c.read_at else None,
-                'is_deleted': c.is_deleted,
-            } for c in chats if not c.is_deleted
-        ]
+        'old_chats': history['messages'],
+        'has_more': history['has_more'],
+        'before': history['before'],
+        'after': history['after'],
     })
 
 
+""" Paginated chat history """
+@token_required
+@require_http_methods(["GET"])
+def chat_history(request, room_name):
+    """Page through a room's messages with ?before=<id> / ?after=<id> and ?limit="""
+    is_member = Room.objects.filter(
+        Q(author=request.user) | Q(friend=request.user),
+        room_id=room_name
+    ).exists()
+    if not is_member:
+        return JsonResponse({'error': 'Room not found'}, status=404)
+
+    return JsonResponse({'room_name': room_name, **_history_page(request, room_name)})
+
+
 @csrf_exempt
 @token_required
 @require_http_methods(["POST"])
@@ -119,19 +212,10 @@ def send_message(request, room_name):
             room_id=room,
             author=request.user,
             friend=friend,
-            text=message_text
+            text=censor(message_text)[:MESSAGE_MAX_LENGTH]
         )
         
-        return JsonResponse({
-            'id': chat.id,
-            'user': chat.author.username,
-            'message': chat.text,
-            'date': chat.date.isoformat(),
-            'status': chat.status,
-            'delivered_at': chat.delivered_at.isoformat() if chat.delivered_at else None,
-            'read_at': chat.read_at.isoformat() if chat.read_at else None,
-            'is_deleted': chat.is_deleted,
-        })
+        return JsonResponse(_serialize_chat(chat))
         
     except Room.DoesNotExist:
         return JsonResponse({'error': 'Room not found'}, status=404)
@@ -139,76 +223,104 @@ def send_message(request, room_name):
         return JsonResponse({'error': str(e)}, status=500)
 
 
-@csrf_exempt
-@token_required
-@require_http_methods(["POST"])
-def mark_messages_delivered(request, room_name):
-    """Mark messages as delivered when recipient fetches them"""
+def _read_up_to_id(request):
+    """Optional `up_to_id` watermark from the query string or JSON body"""
+    up_to_id = request.GET.get('up_to_id')
+    if up_to_id is None and request.body:
+        try:
+            up_to_id = json.loads(request.body).get('up_to_id')
+        except (json.JSONDecodeError, AttributeError):
+            up_to_id = None
+    return _parse_cursor(up_to_id)
+
+
+def _send_receipt(room_id, reader, status, up_to_id, count, at):
+    """Push a delivery/read receipt to everyone connected to the room"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            'chat_%s' % room_id,
+            {
+                'type': 'chat_receipt',
+                'status': status,
+                'reader_id': reader.id,
+                'reader': reader.username,
+                'up_to_id': up_to_id,
+                'count': count,
+                'at': at.isoformat(),
+            }
+        )
+    except Exception as e:
+        logger.warning(f'Could not push {status} receipt for room {room_id}: {str(e)}')
+
+
+def transition_messages(room, reader, from_statuses, status, timestamp_field, up_to_id=None):
+    """
+    Move the friend's messages to `reader` from `from_statuses` to `status`
+    in one UPDATE, stamping `timestamp_field`. Only messages up to `up_to_id`
+    are touched when a watermark is given.
+    Returns (updated_count, last_message_id, timestamp).
+    """
+    friend_id = room.friend_id if room.author_id == reader.id else room.author_id
+    pending = Chat.objects.filter(
+        room_id=room,
+        author_id=friend_id,
+        friend=reader,
+        status__in=from_statuses,
+        is_deleted=False
+    )
+    if up_to_id:
+        pending = pending.filter(id__lte=up_to_id)
+
+    now = timezone.now()
+    last_id = pending.aggregate(last_id=Max('id'))['last_id']
+    if last_id is None:
+        return 0, None, now
+
+    # Bound by the id we report so late arrivals aren't acknowledged unseen
+    updated_count = pending.filter(id__lte=last_id).update(status=status, **{timestamp_field: now})
+    return updated_count, last_id, now
+
+
+def _mark_messages(request, room_name, from_statuses, status, timestamp_field):
     try:
         room = Room.objects.get(room_id=room_name)
-        
-        # Determine who the friend is (the recipient)
-        friend = room.friend if room.author == request.user else room.author
-        
-        # Mark all undelivered messages from friend to current user as delivered
-        undelivered_messages = Chat.objects.filter(
-            room_id=room,
-            author=friend,
-            friend=request.user,
-            status='sent',
-            is_deleted=False
+        up_to_id = _read_up_to_id(request)
+
+        updated_count, last_id, now = transition_messages(
+            room, request.user, from_statuses, status, timestamp_field, up_to_id=up_to_id
         )
-        
-        updated_count = 0
-        for message in undelivered_messages:
-            message.mark_as_delivered()
-            updated_count += 1
-        
+        if updated_count:
+            _send_receipt(room.room_id, request.user, status, last_id, updated_count, now)
+
         return JsonResponse({
             'success': True,
-            'updated_count': updated_count
+            'updated_count': updated_count,
+            'up_to_id': last_id,
         })
-        
+
     except Room.DoesNotExist:
         return JsonResponse({'error': 'Room not found'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@csrf_exempt
+@token_required
+@require_http_methods(["POST"])
+def mark_messages_delivered(request, room_name):
+    """Mark messages as delivered when recipient fetches them"""
+    return _mark_messages(request, room_name, ['sent'], 'delivered', 'delivered_at')
+
+
 @csrf_exempt
 @token_required
 @require_http_methods(["POST"])
 def mark_messages_read(request, room_name):
     """Mark messages as read when recipient views them"""
-    try:
-        room = Room.objects.get(room_id=room_name)
-        
-        # Determine who the friend is (the recipient)
-        friend = room.friend if room.author == request.user else room.author
-        
-        # Mark all unread messages from friend to current user as read
-        unread_messages = Chat.objects.filter(
-            room_id=room,
-            author=friend,
-            friend=request.user,
-            status__in=['sent', 'delivered'],
-            is_deleted=False
-        )
-        
-        updated_count = 0
-        for message in unread_messages:
-            message.mark_as_read()
-            updated_count += 1
-        
-        return JsonResponse({
-            'success': True,
-            'updated_count': updated_count
-        })
-        
-    except Room.DoesNotExist:
-        return JsonResponse({'error': 'Room not found'}, status=404)
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+    return _mark_messages(request, room_name, ['sent', 'delivered'], 'read', 'read_at')
 
 
 @csrf_exempt
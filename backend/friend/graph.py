@@ -0,0 +1,110 @@
+"""
+Friend graph adjacency cache.
+
+Each user's friend ids are cached as one sorted int array, so listings
+can flag many users at once and mutual-friend questions become
+intersections of two arrays that never touch User rows. Entries are dropped
+by friend.signals whenever a friend list changes, whichever path changed it
+(add_friend, remove_friend, unfriend, accept, admin).
+
+The cache is only as fresh as its invalidation reaches: with a per-process
+cache other workers can hold an entry until it expires. Anything that
+grants access or guards a write therefore asks are_friends(), which reads
+the join table, not the cache.
+"""
+import bisect
+from array import array
+
+from django.core.cache import cache
+
+from friend.models import FriendList
+
+
+FRIEND_GRAPH_TTL = 60 * 60
+
+# FriendList.friends join table: one row per (friendlist, user) edge
+FriendEdge = FriendList.friends.through
+
+
+def _cache_key(user_id):
+    return f'friend_graph:{user_id}'
+
+
+def sorted_friend_ids(user_id):
+    """The user's friend ids as a sorted array('q'), cached"""
+    ids = cache.get(_cache_key(user_id))
+    if ids is None:
+        ids = array('q', sorted(
+            FriendEdge.objects.filter(friendlist__user_id=user_id).values_list('user_id', flat=True)
+        ))
+        cache.set(_cache_key(user_id), ids, FRIEND_GRAPH_TTL)
+    return ids
+
+
+def friend_ids_for(user_ids):
+    """{user_id: sorted friend id array} for many users, one cache round-trip and at most one query"""
+    keys = {_cache_key(user_id): user_id for user_id in user_ids}
+    found = {keys[key]: ids for key, ids in cache.get_many(keys).items()}
+    missing = [user_id for user_id in keys.values() if user_id not in found]
+    if missing:
+        edges = {user_id: [] for user_id in missing}
+        for owner_id, friend_id in FriendEdge.objects.filter(
+            friendlist__user_id__in=missing
+        ).values_list('friendlist__user_id', 'user_id'):
+            edges[owner_id].append(friend_id)
+        fresh = {user_id: array('q', sorted(ids)) for user_id, ids in edges.items()}
+        cache.set_many({_cache_key(user_id): ids for user_id, ids in fresh.items()}, FRIEND_GRAPH_TTL)
+        found.update(fresh)
+    return found
+
+
+def friend_ids(user_id):
+    """The user's friend ids as a frozenset, for repeated membership tests"""
+    return frozenset(sorted_friend_ids(user_id))
+
+
+def are_friends(user_id, other_id):
+    """Whether `other_id` is on `user_id`'s friend list, from the database"""
+    return FriendEdge.objects.filter(friendlist__user_id=user_id, user_id=other_id).exists()
+
+
+def friend_count(user_id):
+    """How many friends `user_id` has, from the database so it agrees with listed pages"""
+    return FriendEdge.objects.filter(friendlist__user_id=user_id).count()
+
+
+def intersect_sorted(a, b):
+    """
+    Sorted ids present in both sorted arrays. A short list is probed into a
+    much longer one by binary search (m log n); lists of similar size go
+    through a hash set, which in CPython beats a Python-level merge walk.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return []
+    if len(a) * max(len(b).bit_length(), 1) < len(b):
+        found = []
+        lo = 0
+        for x in a:
+            lo = bisect.bisect_left(b, x, lo)
+            if lo == len(b):
+                break
+            if b[lo] == x:
+                found.append(x)
+        return found
+    return sorted(set(a).intersection(b))
+
+
+def mutual_friend_ids(user_id, other_id):
+    """Sorted ids of the friends two users share"""
+    both = friend_ids_for([user_id, other_id])
+    return intersect_sorted(both[user_id], both[other_id])
+
+
+def mutual_count(user_id, other_id):
+    return len(mutual_friend_ids(user_id, other_id))
+
+
+def invalidate(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
@@ -0,0 +1,138 @@
+import random
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from friend.models import FriendRequest
+
+
+# Indexes added for the active-request lookups, dropped for the "before" run
+ACTIVE_REQUEST_INDEXES = ('unique_active_friend_request', 'friendrequest_active_recv_idx')
+BATCH_SIZE = 20000
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Load synthetic friend requests and report query plans and timings of the '
+        'hot FriendRequest lookups with and without the active-request indexes. '
+        'Everything runs in one transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--active-ratio', type=float, default=0.05, help='Share of requests still pending')
+        parser.add_argument('--samples', type=int, default=200, help='Lookups timed per query')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Rolled back the benchmark data')
+
+    def _run(self, options):
+        rng = random.Random(0)
+        user_ids = self._load_users(options['users'])
+        active_pairs = self._load_requests(rng, user_ids, options['requests'], options['active_ratio'])
+        self._analyze()
+
+        samples = [rng.choice(active_pairs) for _ in range(options['samples'])]
+        with_indexes = self._measure(samples)
+        with connection.cursor() as cursor:
+            for name in ACTIVE_REQUEST_INDEXES:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+        self._analyze()
+        without_indexes = self._measure(samples)
+
+        self.stdout.write('')
+        for name in with_indexes:
+            before, after = without_indexes[name], with_indexes[name]
+            self.stdout.write(
+                f'{name:>20}: {before * 1e6:9.1f} us -> {after * 1e6:7.1f} us per lookup '
+                f'({before / after if after else 0:.1f}x)'
+            )
+
+    def _load_users(self, count):
+        start = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        User.objects.bulk_create(
+            (User(username=f'bench_fr_{start + i}', email=f'bench_fr_{start + i}@example.com', password='!')
+             for i in range(count)),
+            batch_size=BATCH_SIZE,
+        )
+        return list(User.objects.filter(username__startswith='bench_fr_').values_list('id', flat=True))
+
+    def _load_requests(self, rng, user_ids, count, active_ratio):
+        """Insert `count` requests, `active_ratio` of them pending, at most one per pair of users"""
+        active_pairs = set()
+        taken = set()
+        batch = []
+        for i in range(count):
+            sender_id, receiver_id = rng.sample(user_ids, 2)
+            pair = (min(sender_id, receiver_id), max(sender_id, receiver_id))
+            is_active = rng.random() < active_ratio and pair not in taken
+            if is_active:
+                taken.add(pair)
+                active_pairs.add((sender_id, receiver_id))
+            batch.append(FriendRequest(sender_id=sender_id, receiver_id=receiver_id, is_active=is_active))
+            if len(batch) >= BATCH_SIZE:
+                FriendRequest.objects.bulk_create(batch)
+                batch = []
+        FriendRequest.objects.bulk_create(batch)
+        self.stdout.write(f'Loaded {count} friend requests ({len(active_pairs)} active) over {len(user_ids)} users')
+        return list(active_pairs)
+
+    def _analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _lookups(self, sender_id, receiver_id):
+        """The FriendRequest queries the views run, keyed by name"""
+        requests = FriendRequest.objects
+        return {
+            'pair': requests.filter(sender_id=sender_id, receiver_id=receiver_id, is_active=True),
+            'either_direction': requests.filter(
+                Q(sender_id=sender_id, receiver_id=receiver_id, is_active=True) |
+                Q(sender_id=receiver_id, receiver_id=sender_id, is_active=True)
+            ),
+            'incoming': requests.filter(receiver_id=receiver_id, is_active=True).order_by('-timestamp')[:50],
+            'pending_for_user': requests.filter(
+                Q(sender_id=sender_id, is_active=True) | Q(receiver_id=sender_id, is_active=True)
+            ),
+        }
+
+    def _measure(self, samples):
+        label = 'with' if self._has_indexes() else 'without'
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\nPlans {label} the active-request indexes'))
+        for name, qs in self._lookups(*samples[0]).items():
+            self.stdout.write(f'{name}:')
+            for line in qs.explain().splitlines():
+                self.stdout.write(f'    {line}')
+
+        # Time the compiled SQL so ORM overhead doesn't drown the index effect
+        timings = {}
+        with connection.cursor() as cursor:
+            for name in self._lookups(*samples[0]):
+                statements = [self._lookups(*pair)[name].query.sql_with_params() for pair in samples]
+
+                def run():
+                    for sql, params in statements:
+                        cursor.execute(sql, params)
+                        cursor.fetchall()
+
+                best = min(timeit.repeat(run, number=1, repeat=3))
+                timings[name] = best / len(samples)
+        return timings
+
+    def _has_indexes(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, FriendRequest._meta.db_table)
+        return all(name in constraints for name in ACTIVE_REQUEST_INDEXES)
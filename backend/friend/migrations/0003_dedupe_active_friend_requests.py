@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:04
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def deactivate_duplicates(apps, schema_editor):
+    """Keep only the newest active request per (sender, receiver) pair"""
+    FriendRequest = apps.get_model('friend', 'FriendRequest')
+    duplicates = (
+        FriendRequest.objects.filter(is_active=True)
+        .values('sender_id', 'receiver_id')
+        .annotate(n=Count('id'), newest=Max('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        FriendRequest.objects.filter(
+            sender_id=row['sender_id'], receiver_id=row['receiver_id'], is_active=True
+        ).exclude(id=row['newest']).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friend', '0002_make_email_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friend', '0003_dedupe_active_friend_requests'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['receiver', '-timestamp'], name='friendrequest_active_recv_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='friendrequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('sender', 'receiver'), name='unique_active_friend_request'),
+        ),
+    ]
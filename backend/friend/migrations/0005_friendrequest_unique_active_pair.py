@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Greatest, Least
+
+
+def deactivate_reverse_duplicates(apps, schema_editor):
+    """
+    Keep only the newest active request per pair of users. 0003 already
+    left one per direction, so this settles A->B against B->A.
+    """
+    FriendRequest = apps.get_model('friend', 'FriendRequest')
+    duplicates = (
+        FriendRequest.objects.filter(is_active=True)
+        .values(low=Least('sender_id', 'receiver_id'), high=Greatest('sender_id', 'receiver_id'))
+        .annotate(n=Count('id'), newest=Max('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        FriendRequest.objects.filter(
+            Q(sender_id=row['low'], receiver_id=row['high']) | Q(sender_id=row['high'], receiver_id=row['low']),
+            is_active=True,
+        ).exclude(id=row['newest']).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friend', '0004_friendrequest_active_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_reverse_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friendrequest',
+            constraint=models.UniqueConstraint(Least('sender', 'receiver'), Greatest('sender', 'receiver'), condition=models.Q(('is_active', True)), name='unique_active_friend_request_pair'),
+        ),
+    ]
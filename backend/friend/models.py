@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest, Least
 from django.db.models.fields.related import ForeignKey
 from django.utils import timezone
 from django.contrib.auth.models import User
@@ -13,14 +14,11 @@ class FriendList(models.Model):
         return self.user.username
 
     def add_friend(self, account):
-        if not account in self.friends.all():
-            self.friends.add(account)
-            self.save()
+        # add() and remove() skip edges that already (or no longer) exist
+        self.friends.add(account)
 
     def remove_friend(self, account):
-        if account in self.friends.all():
-            self.friends.remove(account)
-            self.save()
+        self.friends.remove(account)
 
     def unfriend(self, removee):
         remover_friends_list = self
@@ -30,9 +28,8 @@ class FriendList(models.Model):
         friends_list.remove_friend(self.user)
 
     def is_mutual_friend(self, friend):
-        if friend in self.friends.all():
-            return True
-        return False
+        from friend import graph
+        return graph.are_friends(self.user_id, friend.pk)
 
 
 """ Friend Request model """
@@ -42,19 +39,63 @@ class FriendRequest(models.Model):
     is_active = models.BooleanField(blank=True, null=True, default=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # One pending request per direction; its index also serves the
+            # (sender, receiver, is_active) lookups
+            models.UniqueConstraint(
+                fields=['sender', 'receiver'],
+                condition=models.Q(is_active=True),
+                name='unique_active_friend_request',
+            ),
+            # ... and one per pair of users, whichever of them sent it
+            models.UniqueConstraint(
+                Least('sender', 'receiver'),
+                Greatest('sender', 'receiver'),
+                condition=models.Q(is_active=True),
+                name='unique_active_friend_request_pair',
+            ),
+        ]
+        indexes = [
+            # A user's incoming pending requests, newest first
+            models.Index(
+                fields=['receiver', '-timestamp'],
+                condition=models.Q(is_active=True),
+                name='friendrequest_active_recv_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.sender.username
 
     def accept(self):
-        # update both sender and receiver friend list
-        receiver_friend_list = FriendList.objects.get(user=self.receiver)
-        if receiver_friend_list:
-            receiver_friend_list.add_friend(self.sender)
-            sender_friend_list = FriendList.objects.get(user=self.sender)
-            if sender_friend_list:
-                sender_friend_list.add_friend(self.receiver)
-                self.is_active = False
-                self.save()
+        """
+        Befriend sender and receiver and close the request in one transaction.
+        The request is claimed first with a conditional UPDATE, so of two
+        concurrent accepts only one sees a row change, on every backend (row
+        locks are a no-op on SQLite). Returns False when the request was no
+        longer active.
+        """
+        from friend import graph
+        from friend.suggestions import invalidate_suggestions
+
+        with transaction.atomic():
+            if not FriendRequest.objects.filter(pk=self.pk, is_active=True).update(is_active=False):
+                return False
+            user_ids = (self.sender_id, self.receiver_id)
+            list_ids = dict(FriendList.objects.filter(user_id__in=user_ids).values_list('user_id', 'id'))
+            for user_id in user_ids:
+                if user_id not in list_ids:
+                    list_ids[user_id] = FriendList.objects.create(user_id=user_id).id
+            # Both edges in one INSERT; m2m_changed doesn't fire for it, so the
+            # caches it would have dropped are dropped on commit instead
+            FriendList.friends.through.objects.bulk_create([
+                FriendList.friends.through(friendlist_id=list_ids[self.receiver_id], user_id=self.sender_id),
+                FriendList.friends.through(friendlist_id=list_ids[self.sender_id], user_id=self.receiver_id),
+            ], ignore_conflicts=True)
+            transaction.on_commit(lambda: (graph.invalidate(*user_ids), invalidate_suggestions(*user_ids)))
+        self.is_active = False
+        return True
 
     def decline(self):
         self.is_active = False
@@ -0,0 +1,26 @@
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+from .models import FriendList, FriendRequest
+from . import graph
+from .suggestions import invalidate_suggestions
+
+
+""" Dropping cached suggestions and adjacency when a friend list changes """
+@receiver(m2m_changed, sender=FriendList.friends.through)
+def friends_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, FriendList):
+        invalidate_suggestions(instance.user_id, *(pk_set or ()))
+        graph.invalidate(instance.user_id)
+    else:
+        # Reverse side: instance is a User, pk_set holds FriendList ids
+        owners = list(FriendList.objects.filter(pk__in=pk_set or ()).values_list('user_id', flat=True))
+        invalidate_suggestions(instance.pk, *owners)
+        graph.invalidate(*owners)
+
+
+""" Dropping cached suggestions when a friend request is sent or answered """
+@receiver(post_save, sender=FriendRequest)
+def friend_request_changed(sender, instance, **kwargs):
+    invalidate_suggestions(instance.sender_id, instance.receiver_id)
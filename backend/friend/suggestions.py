@@ -0,0 +1,139 @@
+import heapq
+import random
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from friend import graph
+from friend.graph import FriendEdge
+from friend.models import FriendRequest
+from users import presence
+
+
+SUGGESTION_LIMIT = 15
+SUGGESTION_CACHE_TTL = 600
+
+
+def _cache_key(user_id):
+    return f'friend_suggestions:{user_id}'
+
+
+def invalidate_suggestions(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def _pending_request(user_id, candidate_ref):
+    """Active friend request in either direction between user and candidate"""
+    return FriendRequest.objects.filter(
+        Q(sender_id=user_id, receiver_id=candidate_ref, is_active=True) |
+        Q(sender_id=candidate_ref, receiver_id=user_id, is_active=True)
+    )
+
+
+def mutual_friend_candidates(user_id, limit=SUGGESTION_LIMIT):
+    """
+    Friends of the user's friends ranked by mutual friend count, counted
+    over the cached friend-id arrays. Existing friends, the user and
+    anyone with a pending request either way are excluded.
+    Returns [(candidate_id, mutual_count), ...].
+    """
+    my_friend_ids = graph.sorted_friend_ids(user_id)
+    mutual = Counter()
+    for ids in graph.friend_ids_for(my_friend_ids).values():
+        mutual.update(ids)
+    for excluded in (user_id, *my_friend_ids):
+        mutual.pop(excluded, None)
+    if not mutual:
+        return []
+
+    pending = set()
+    for sender_id, receiver_id in FriendRequest.objects.filter(
+        Q(sender_id=user_id, is_active=True) | Q(receiver_id=user_id, is_active=True)
+    ).values_list('sender_id', 'receiver_id'):
+        pending.add(receiver_id if sender_id == user_id else sender_id)
+    return heapq.nsmallest(
+        limit,
+        ((candidate_id, count) for candidate_id, count in mutual.items() if candidate_id not in pending),
+        key=lambda item: (-item[1], item[0]),
+    )
+
+
+def fallback_candidates(user_id, exclude_ids, limit):
+    """Newest users with no friendship or pending request with the user"""
+    my_friend_ids = FriendEdge.objects.filter(friendlist__user_id=user_id).values('user_id')
+    return list(
+        User.objects
+        .exclude(id=user_id)
+        .exclude(id__in=my_friend_ids)
+        .exclude(id__in=exclude_ids)
+        .filter(~Exists(_pending_request(user_id, OuterRef('id'))))
+        .order_by('-id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def _score(mutual_count, is_online, profile):
+    score = mutual_count * 10
+    if is_online:
+        score += 5  # Online users get priority
+    if profile is not None:
+        # Bonus for profile completeness
+        if profile.bio and profile.bio.strip():
+            score += 2
+        if profile.image:
+            score += 2
+    # Add some randomization to avoid always showing same suggestions
+    return score + random.uniform(0, 3)
+
+
+def build_suggestions(user_id, limit=SUGGESTION_LIMIT):
+    mutual = dict(mutual_friend_candidates(user_id, limit))
+    fallback = []
+    if len(mutual) < 10:
+        fallback = fallback_candidates(user_id, list(mutual), 5)
+
+    candidate_ids = list(mutual) + fallback
+    users = User.objects.select_related('profile').in_bulk(candidate_ids)
+    online = presence.online_ids(candidate_ids)
+
+    suggestions = []
+    for candidate_id in candidate_ids:
+        user_obj = users.get(candidate_id)
+        if user_obj is None:
+            continue
+        profile = getattr(user_obj, 'profile', None)
+        mutual_count = mutual.get(candidate_id, 0)
+        if candidate_id in mutual:
+            score = _score(mutual_count, candidate_id in online, profile)
+        else:
+            score = random.uniform(1, 3)  # Low score for new users
+        suggestions.append({
+            'id': user_obj.id,
+            'username': user_obj.username,
+            'first_name': user_obj.first_name or '',
+            'last_name': user_obj.last_name or '',
+            'email': user_obj.email or '',
+            'is_online': candidate_id in online,
+            'bio': (profile.bio or '') if profile else '',
+            'image': profile.image.url if profile and profile.image else None,
+            'mutual_friends_count': mutual_count,
+            'score': round(score, 2)  # For debugging
+        })
+
+    suggestions.sort(key=lambda s: s['score'], reverse=True)
+    return suggestions[:limit]
+
+
+def get_suggestions(user_id, limit=SUGGESTION_LIMIT):
+    """Ranked suggestions for the user, cached until their friendships change"""
+    suggestions = cache.get(_cache_key(user_id))
+    if suggestions is None:
+        suggestions = build_suggestions(user_id, limit)
+        cache.set(_cache_key(user_id), suggestions, SUGGESTION_CACHE_TTL)
+        return suggestions
+
+    # Ranking is cached, presence is not
+    online = presence.online_ids([s['id'] for s in suggestions])
+    return [{**s, 'is_online': s['id'] in online} for s in suggestions]
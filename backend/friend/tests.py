@@ -1,3 +1,151 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from rest_framework.authtoken.models import Token
 
-# Create your tests here.
+from chat.models import Room
+from friend import graph
+from friend.models import FriendList, FriendRequest
+from notification.models import Notification
+
+
+def make_user(username):
+    return User.objects.create_user(username, f'{username}@example.com', 'pw')
+
+
+class FriendGraphTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.alice_list = FriendList.objects.get(user=self.alice)
+        self.bob_list = FriendList.objects.get(user=self.bob)
+
+    def test_cache_follows_friend_list_changes(self):
+        self.assertEqual(graph.friend_ids(self.alice.id), frozenset())
+        self.alice_list.add_friend(self.bob)
+        self.assertEqual(graph.friend_ids(self.alice.id), {self.bob.id})
+        self.alice_list.remove_friend(self.bob)
+        self.assertEqual(graph.friend_ids(self.alice.id), frozenset())
+
+    def test_stale_cache_does_not_skip_removal_or_grant_access(self):
+        self.alice_list.add_friend(self.bob)
+        graph.sorted_friend_ids(self.alice.id)
+        # Another worker's change that never reached this process's cache
+        FriendList.friends.through.objects.filter(friendlist=self.alice_list).delete()
+        self.assertFalse(graph.are_friends(self.alice.id, self.bob.id))
+
+        FriendList.friends.through.objects.create(friendlist=self.alice_list, user=self.bob)
+        self.alice_list.remove_friend(self.bob)
+        self.assertFalse(self.alice_list.friends.filter(pk=self.bob.pk).exists())
+
+    def test_unfriend_removes_both_directions(self):
+        self.alice_list.add_friend(self.bob)
+        self.bob_list.add_friend(self.alice)
+        self.alice_list.unfriend(self.bob)
+        self.assertFalse(graph.are_friends(self.alice.id, self.bob.id))
+        self.assertFalse(graph.are_friends(self.bob.id, self.alice.id))
+
+    def test_mutual_friend_ids(self):
+        carol, dave = make_user('carol'), make_user('dave')
+        for friend in (carol, dave):
+            self.alice_list.add_friend(friend)
+        self.bob_list.add_friend(dave)
+        self.assertEqual(graph.mutual_friend_ids(self.alice.id, self.bob.id), [dave.id])
+
+    def test_intersect_sorted_matches_set_intersection(self):
+        short, long = [3, 50, 900], list(range(0, 2000, 3))
+        self.assertEqual(graph.intersect_sorted(short, long), [3, 900])
+        self.assertEqual(graph.intersect_sorted(long, short), [3, 900])
+        self.assertEqual(graph.intersect_sorted([1, 2, 3], [2, 3, 4]), [2, 3])
+        self.assertEqual(graph.intersect_sorted([], long), [])
+
+
+class AcceptFriendRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.request = FriendRequest.objects.create(sender=self.alice, receiver=self.bob)
+
+    def test_accept_befriends_both_and_closes_request(self):
+        self.assertTrue(self.request.accept())
+        self.assertTrue(graph.are_friends(self.alice.id, self.bob.id))
+        self.assertTrue(graph.are_friends(self.bob.id, self.alice.id))
+        self.assertFalse(FriendRequest.objects.get(pk=self.request.pk).is_active)
+        self.assertEqual(graph.friend_ids(self.bob.id), {self.alice.id})
+
+    def test_concurrent_accepts_claim_the_request_once(self):
+        # Both taps loaded the request while it was still active
+        first = FriendRequest.objects.get(pk=self.request.pk)
+        second = FriendRequest.objects.get(pk=self.request.pk)
+        self.assertTrue(first.accept())
+        self.assertFalse(second.accept())
+        self.assertEqual(FriendList.friends.through.objects.count(), 2)
+
+    def test_accept_view_is_idempotent(self):
+        headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.bob).key}'}
+        url = f'/friend/friend_request_accept/{self.request.pk}/'
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        room_id = response.json()['room_id']
+        self.assertEqual(self.client.get(url, **headers).status_code, 400)
+
+        self.assertEqual(Room.objects.count(), 1)
+        self.assertEqual(Room.objects.get().room_id, room_id)
+        self.assertEqual(Notification.objects.filter(notification_type=8, user=self.alice).count(), 1)
+
+    def test_only_receiver_can_accept(self):
+        headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.alice).key}'}
+        response = self.client.get(f'/friend/friend_request_accept/{self.request.pk}/', **headers)
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(FriendRequest.objects.get(pk=self.request.pk).is_active)
+
+
+class SendFriendRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+
+    def _send(self, sender, receiver):
+        return self.client.post(
+            '/friend/friend_request/', {'receiver_user_id': receiver.id},
+            HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=sender)[0].key}',
+        )
+
+    def test_one_active_request_per_pair(self):
+        self.assertEqual(self._send(self.alice, self.bob).status_code, 200)
+        response = self._send(self.alice, self.bob)
+        self.assertEqual(response.json()['error'], 'Friend request already sent')
+        response = self._send(self.bob, self.alice)
+        self.assertEqual(response.json()['error'], 'This user has already sent you a friend request')
+        self.assertEqual(FriendRequest.objects.filter(is_active=True).count(), 1)
+
+    def test_constraint_rejects_reverse_request(self):
+        FriendRequest.objects.create(sender=self.alice, receiver=self.bob)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FriendRequest.objects.create(sender=self.bob, receiver=self.alice)
+        # Closed requests don't count
+        FriendRequest.objects.update(is_active=False)
+        FriendRequest.objects.create(sender=self.bob, receiver=self.alice)
+
+
+class FriendsListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice')
+        self.alice_list = FriendList.objects.get(user=self.alice)
+        for name in ('bob', 'carol', 'dave'):
+            self.alice_list.add_friend(make_user(name))
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.alice).key}'}
+
+    def test_count_matches_the_database_when_the_cache_is_stale(self):
+        graph.sorted_friend_ids(self.alice.id)
+        # Another worker's change that never reached this process's cache
+        FriendList.friends.through.objects.filter(friendlist=self.alice_list, user__username='dave').delete()
+        body = self.client.get(f'/friend/list/{self.alice.id}', {'limit': 2}, **self.headers).json()
+        self.assertEqual(body['count'], 2)
+        self.assertEqual([f['username'] for f in body['friends']], ['bob', 'carol'])
+        self.assertFalse(body['has_more'])
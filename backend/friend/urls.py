@@ -1,6 +1,6 @@
 from django.urls import path
 from django.urls.resolvers import URLPattern
-from friend.views import cancel_friend_request, decline_friend_request, friend_requests, friends_list_view, remove_friend, send_friend_request, accept_friend_request, friend_suggestions
+from friend.views import cancel_friend_request, decline_friend_request, friend_requests, friends_list_view, remove_friend, send_friend_request, accept_friend_request, friend_suggestions, mutual_friends
 
 app_name = "friend"
 
@@ -13,4 +13,5 @@ urlpatterns = [
     path('friend_request_decline/<friend_request_id>/', decline_friend_request, name='friend-request-decline'),
     path('friend_request_cancel/', cancel_friend_request, name='friend-request-cancel'),
     path('suggestions/', friend_suggestions, name='friend-suggestions'),
+    path('mutual/<int:user_id>/', mutual_friends, name='mutual-friends'),
 ]
\ No newline at end of file
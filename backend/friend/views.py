@@ -1,12 +1,15 @@
 from django.shortcuts import redirect
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+import bisect
 import json
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from friend.models import FriendList, FriendRequest
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_http_methods
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 import sys
 import os
@@ -14,13 +17,57 @@ import os
 # Add the parent directory to the path to import from users app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from users.views import token_required
-from users.models import Profile
+from users import presence
+from friend.suggestions import get_suggestions
+from friend import graph as friend_graph
 from notification.models import Notification
 from chat.models import Room, Chat
 
 
+FRIENDS_PAGE_SIZE = 50
+FRIENDS_MAX_PAGE_SIZE = 200
+
+# Response field -> columns it needs from the friends query
+FRIEND_FIELDS = {
+    'id': ('id',),
+    'username': ('username',),
+    'first_name': ('first_name',),
+    'last_name': ('last_name',),
+    'email': ('email',),
+    'is_online': ('profile__show_online_status',),
+    'bio': ('profile__bio',),
+    'image': ('profile__image',),
+    'is_mutual': (),
+}
+
+
+def get_friends_page(user_id, columns, after=None, limit=FRIENDS_PAGE_SIZE):
+    """
+    Keyset page of a user's friends ordered by id, as dicts of `columns`
+    with profile columns joined in. Returns (rows, has_more).
+    """
+    friends = User.objects.filter(friends__user_id=user_id)
+    if after:
+        friends = friends.filter(id__gt=after)
+    page = list(friends.order_by('id').values('id', *columns)[:limit + 1])
+    return page[:limit], len(page) > limit
+
+
+def _friend_fields(request):
+    """Fields asked for with ?fields=a,b (id is always included); raises ValueError on unknown ones"""
+    fields = [f for f in request.GET.get('fields', '').split(',') if f]
+    if not fields:
+        return list(FRIEND_FIELDS)
+    unknown = set(fields) - set(FRIEND_FIELDS)
+    if unknown:
+        raise ValueError(', '.join(sorted(unknown)))
+    return ['id'] + [f for f in fields if f != 'id']
+
+
+""" Friends of a user, with presence and mutual-with-viewer flags """
 @token_required
 def friends_list_view(request, *args, **kwargs):
+    """Pass the last friend id as ?after= for the next page; ?fields=id,username to trim the payload"""
     user = request.user
     user_id = kwargs.get("user_id")
     
@@ -29,78 +76,47 @@ def friends_list_view(request, *args, **kwargs):
     
     try:
         this_user = User.objects.get(pk=user_id)
-    except User.DoesNotExist:
+    except (User.DoesNotExist, ValueError):
         return JsonResponse({'error': 'User does not exist'}, status=404)
     
-    try:
-        friend_list = FriendList.objects.get(user=this_user)
-    except FriendList.DoesNotExist:
-        return JsonResponse({'error': f'Could not find a friends list for {this_user.username}'}, status=404)
-    
     # Must be friends to view a friends list (unless it's your own)
     if user != this_user:
-        if not user in friend_list.friends.all():
+        if not friend_graph.are_friends(this_user.id, user.id):
             return JsonResponse({'error': 'You must be friends to view their friends list'}, status=403)
-    
-    # Get friends with mutual status
-    friends = []
+
     try:
-        auth_user_friend_list = FriendList.objects.get(user=user)
-        for friend in friend_list.friends.all():
-            try:
-                friend_profile = Profile.objects.get(user=friend)
-                is_mutual = auth_user_friend_list.is_mutual_friend(friend)
-                friends.append({
-                    'id': friend.id,
-                    'username': friend.username,
-                    'first_name': friend.first_name or '',
-                    'last_name': friend.last_name or '',
-                    'email': friend.email,
-                    'is_online': friend_profile.is_online,
-                    'bio': friend_profile.bio or '',
-                    'image': friend_profile.image.url if friend_profile.image else '/media/default.jpg',
-                    'is_mutual': is_mutual
-                })
-            except Profile.DoesNotExist:
-                friends.append({
-                    'id': friend.id,
-                    'username': friend.username,
-                    'first_name': friend.first_name or '',
-                    'last_name': friend.last_name or '',
-                    'email': friend.email,
-                    'is_online': False,
-                    'bio': '',
-                    'image': '/media/default.jpg',
-                    'is_mutual': False
-                })
-    except FriendList.DoesNotExist:
-        # If auth user has no friend list, just return friends without mutual status
-        for friend in friend_list.friends.all():
-            try:
-                friend_profile = Profile.objects.get(user=friend)
-                friends.append({
-                    'id': friend.id,
-                    'username': friend.username,
-                    'first_name': friend.first_name or '',
-                    'last_name': friend.last_name or '',
-                    'email': friend.email,
-                    'is_online': friend_profile.is_online,
-                    'bio': friend_profile.bio or '',
-                    'image': friend_profile.image.url if friend_profile.image else '/media/default.jpg',
-                    'is_mutual': False
-                })
-            except Profile.DoesNotExist:
-                friends.append({
-                    'id': friend.id,
-                    'username': friend.username,
-                    'first_name': friend.first_name or '',
-                    'last_name': friend.last_name or '',
-                    'email': friend.email,
-                    'is_online': False,
-                    'bio': '',
-                    'image': '/media/default.jpg',
-                    'is_mutual': False
-                })
+        after = int(request.GET.get('after', 0)) or None
+        limit = int(request.GET.get('limit', FRIENDS_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+    limit = max(1, min(limit, FRIENDS_MAX_PAGE_SIZE))
+    try:
+        fields = _friend_fields(request)
+    except ValueError as e:
+        return JsonResponse({'error': f'Unknown fields: {e}'}, status=400)
+
+    columns = sorted({column for field in fields for column in FRIEND_FIELDS[field]} - {'id'})
+    rows, has_more = get_friends_page(this_user.id, columns, after=after, limit=limit)
+
+    page_ids = {row['id'] for row in rows}
+    online = presence.online_ids(page_ids) if 'is_online' in fields else set()
+    mutual = page_ids & friend_graph.friend_ids(user.id) if 'is_mutual' in fields else set()
+
+    friends = []
+    for row in rows:
+        friend = {
+            'id': row['id'],
+            'username': row.get('username'),
+            'first_name': row.get('first_name') or '',
+            'last_name': row.get('last_name') or '',
+            'email': row.get('email'),
+            # No profile row means no preference was saved, so presence shows
+            'is_online': row['id'] in online and row.get('profile__show_online_status') is not False,
+            'bio': row.get('profile__bio') or '',
+            'image': default_storage.url(row['profile__image']) if row.get('profile__image') else '/media/default.jpg',
+            'is_mutual': row['id'] in mutual,
+        }
+        friends.append({field: friend[field] for field in fields})
     
     return JsonResponse({
         'this_user': {
@@ -110,7 +126,9 @@ def friends_list_view(request, *args, **kwargs):
             'last_name': this_user.last_name or ''
         },
         'friends': friends,
-        'count': len(friends)
+        'count': friend_graph.friend_count(this_user.id),
+        'has_more': has_more,
+        'next_after': rows[-1]['id'] if rows and has_more else None,
     })
 
 
@@ -132,7 +150,10 @@ def friend_requests(request, *args, **kwargs):
     if account != user:
         return JsonResponse({'error': 'You can only view your own friend requests'}, status=403)
     
-    friend_requests = FriendRequest.objects.filter(receiver=account, is_active=True)
+    friend_requests = (
+        FriendRequest.objects.filter(receiver=account, is_active=True)
+        .select_related('sender', 'receiver').order_by('-timestamp')
+    )
     
     requests_data = []
     for fr in friend_requests:
@@ -190,9 +211,9 @@ def send_friend_request(request, *args, **kwargs):
     
     try:
         # Check if there's already an active friend request in either direction
+        # is_active in each branch lets both use the partial active-request indexes
         existing_requests = FriendRequest.objects.filter(
-            (Q(sender=user) & Q(receiver=receiver)) | (Q(sender=receiver) & Q(receiver=user)),
-            is_active=True
+            Q(sender=user, receiver=receiver, is_active=True) | Q(sender=receiver, receiver=user, is_active=True)
         )
         
         if existing_requests.exists():
@@ -203,16 +224,18 @@ def send_friend_request(request, *args, **kwargs):
                 return JsonResponse({'error': 'This user has already sent you a friend request'}, status=400)
         
         # Check if they're already friends
-        try:
-            user_friend_list = FriendList.objects.get(user=user)
-            if user_friend_list.is_mutual_friend(receiver):
-                return JsonResponse({'error': 'Already friends'}, status=400)
-        except FriendList.DoesNotExist:
-            pass
+        if friend_graph.are_friends(user.id, receiver.id):
+            return JsonResponse({'error': 'Already friends'}, status=400)
         
-        # Create the friend request
-        friend_request = FriendRequest(sender=user, receiver=receiver)
-        friend_request.save()
+        # Create the friend request; a concurrent request between the two, in
+        # either direction, trips unique_active_friend_request_pair
+        try:
+            with transaction.atomic():
+                friend_request = FriendRequest.objects.create(sender=user, receiver=receiver)
+        except IntegrityError:
+            if existing_requests.filter(sender=receiver).exists():
+                return JsonResponse({'error': 'This user has already sent you a friend request'}, status=400)
+            return JsonResponse({'error': 'Friend request already sent'}, status=400)
         
         # Create notification for the receiver
         notification = Notification.objects.create(
@@ -232,177 +255,50 @@ def send_friend_request(request, *args, **kwargs):
         return JsonResponse({'error': str(e)}, status=500)
     
 
+""" Friends the viewer shares with another user """
+@token_required
+@require_http_methods(["GET"])
+def mutual_friends(request, user_id):
+    """Pass the last friend id as ?after= for the next page; ?count_only=1 skips the user rows"""
+    if not User.objects.filter(pk=user_id).exists():
+        return JsonResponse({'error': 'User does not exist'}, status=404)
+    try:
+        after = int(request.GET.get('after', 0)) or None
+        limit = int(request.GET.get('limit', FRIENDS_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+    limit = max(1, min(limit, FRIENDS_MAX_PAGE_SIZE))
+
+    mutual_ids = friend_graph.mutual_friend_ids(request.user.id, user_id)
+    if request.GET.get('count_only') in ('1', 'true'):
+        return JsonResponse({'user_id': user_id, 'count': len(mutual_ids)})
+
+    start = bisect.bisect_right(mutual_ids, after) if after else 0
+    page_ids = mutual_ids[start:start + limit]
+    has_more = start + limit < len(mutual_ids)
+    rows = User.objects.filter(id__in=page_ids).order_by('id').values(
+        'id', 'username', 'first_name', 'last_name', 'profile__image'
+    )
+    return JsonResponse({
+        'user_id': user_id,
+        'count': len(mutual_ids),
+        'mutual_friends': [{
+            'id': row['id'],
+            'username': row['username'],
+            'first_name': row['first_name'] or '',
+            'last_name': row['last_name'] or '',
+            'image': default_storage.url(row['profile__image']) if row['profile__image'] else '/media/default.jpg',
+        } for row in rows],
+        'has_more': has_more,
+        'next_after': page_ids[-1] if page_ids and has_more else None,
+    })
+
+
 @token_required
 def friend_suggestions(request):
     """Get intelligent friend suggestions based on mutual friends, online status, and other criteria"""
-    user = request.user
-
     try:
-        # Get user's friend list
-        user_friend_list = FriendList.objects.get(user=user)
-        user_friends = set(user_friend_list.friends.all())
-
-        # Dictionary to store potential suggestions with their scores
-        suggestions_dict = {}
-
-        # Find users who are friends with user's friends but not with the user
-        for friend in user_friends:
-            try:
-                friend_friend_list = FriendList.objects.get(user=friend)
-                friend_friends = friend_friend_list.friends.all()
-
-                for potential_friend in friend_friends:
-                    if (potential_friend != user and
-                        potential_friend not in user_friends and
-                        not FriendRequest.objects.filter(
-                            sender=user,
-                            receiver=potential_friend,
-                            is_active=True
-                        ).exists() and
-                        not FriendRequest.objects.filter(
-                            sender=potential_friend,
-                            receiver=user,
-                            is_active=True
-                        ).exists()):
-
-                        # Calculate mutual friends count
-                        mutual_friends_count = 0
-                        try:
-                            potential_friend_list = FriendList.objects.get(user=potential_friend)
-                            for mutual_friend in potential_friend_list.friends.all():
-                                if mutual_friend in user_friends:
-                                    mutual_friends_count += 1
-                        except FriendList.DoesNotExist:
-                            pass
-
-                        # Initialize or update suggestion score
-                        if potential_friend.id not in suggestions_dict:
-                            suggestions_dict[potential_friend.id] = {
-                                'user': potential_friend,
-                                'mutual_friends_count': mutual_friends_count,
-                                'score': 0
-                            }
-
-                        # Update mutual friends count if higher
-                        if mutual_friends_count > suggestions_dict[potential_friend.id]['mutual_friends_count']:
-                            suggestions_dict[potential_friend.id]['mutual_friends_count'] = mutual_friends_count
-
-            except FriendList.DoesNotExist:
-                continue
-
-        # Calculate scores for each suggestion
-        for suggestion_id, suggestion_data in suggestions_dict.items():
-            score = 0
-
-            # Base score from mutual friends (higher mutual friends = higher score)
-            score += suggestion_data['mutual_friends_count'] * 10
-
-            # Bonus for online status
-            try:
-                profile = Profile.objects.get(user=suggestion_data['user'])
-                if profile.is_online:
-                    score += 5  # Online users get priority
-
-                # Bonus for profile completeness
-                if profile.bio and profile.bio.strip():
-                    score += 2
-                if profile.image:
-                    score += 2
-
-                # Store profile data
-                suggestion_data['profile'] = profile
-                suggestion_data['is_online'] = profile.is_online
-                suggestion_data['bio'] = profile.bio or ''
-                suggestion_data['image'] = profile.image.url if profile.image else None
-
-            except Profile.DoesNotExist:
-                suggestion_data['profile'] = None
-                suggestion_data['is_online'] = False
-                suggestion_data['bio'] = ''
-                suggestion_data['image'] = None
-
-            # Add some randomization to avoid always showing same suggestions
-            import random
-            score += random.uniform(0, 3)
-
-            suggestion_data['score'] = score
-
-        # Sort by score (highest first) and take top 15
-        sorted_suggestions = sorted(
-            suggestions_dict.values(),
-            key=lambda x: x['score'],
-            reverse=True
-        )[:15]
-
-        # If we don't have enough suggestions, add some users with no mutual friends
-        if len(sorted_suggestions) < 10:
-            # Get all users except current user and their friends
-            excluded_users = {user.id}
-            excluded_users.update(friend.id for friend in user_friends)
-            excluded_users.update(suggestion['user'].id for suggestion in sorted_suggestions)
-
-            # Get users who haven't sent/received friend requests
-            potential_new_users = User.objects.exclude(id__in=excluded_users)
-
-            # Filter out users with active friend requests
-            available_users = []
-            for potential_user in potential_new_users:
-                has_request = FriendRequest.objects.filter(
-                    (Q(sender=user) & Q(receiver=potential_user)) |
-                    (Q(sender=potential_user) & Q(receiver=user)),
-                    is_active=True
-                ).exists()
-
-                if not has_request:
-                    available_users.append(potential_user)
-
-            # Add up to 5 more users with lower priority
-            for new_user in available_users[:5]:
-                try:
-                    profile = Profile.objects.get(user=new_user)
-                    sorted_suggestions.append({
-                        'user': new_user,
-                        'mutual_friends_count': 0,
-                        'score': random.uniform(1, 3),  # Low score for new users
-                        'profile': profile,
-                        'is_online': profile.is_online,
-                        'bio': profile.bio or '',
-                        'image': profile.image.url if profile.image else None,
-                    })
-                except Profile.DoesNotExist:
-                    sorted_suggestions.append({
-                        'user': new_user,
-                        'mutual_friends_count': 0,
-                        'score': random.uniform(1, 3),
-                        'profile': None,
-                        'is_online': False,
-                        'bio': '',
-                        'image': None,
-                    })
-
-        # Sort again by score and take top 15
-        sorted_suggestions = sorted(
-            sorted_suggestions,
-            key=lambda x: x['score'],
-            reverse=True
-        )[:15]
-
-        # Format the response
-        suggestions_data = []
-        for suggestion in sorted_suggestions:
-            user_obj = suggestion['user']
-            suggestions_data.append({
-                'id': user_obj.id,
-                'username': user_obj.username,
-                'first_name': user_obj.first_name or '',
-                'last_name': user_obj.last_name or '',
-                'email': user_obj.email or '',
-                'is_online': suggestion.get('is_online', False),
-                'bio': suggestion.get('bio', ''),
-                'image': suggestion.get('image', None),
-                'mutual_friends_count': suggestion.get('mutual_friends_count', 0),
-                'score': round(suggestion.get('score', 0), 2)  # For debugging
-            })
+        suggestions_data = get_suggestions(request.user.id)
 
         return JsonResponse({
             'success': True,
@@ -410,12 +306,6 @@ def friend_suggestions(request):
             'count': len(suggestions_data)
         })
 
-    except FriendList.DoesNotExist:
-        return JsonResponse({
-            'success': True,
-            'suggestions': [],
-            'count': 0
-        })
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -470,45 +360,37 @@ def accept_friend_request(request, *args, **kwargs):
     
     try:
         friend_request = FriendRequest.objects.get(pk=friend_request_id)
-    except FriendRequest.DoesNotExist:
+    except (FriendRequest.DoesNotExist, ValueError):
         return JsonResponse({'error': 'Friend request does not exist'}, status=404)
     
     # Confirm that this is the correct request for this user
-    if friend_request.receiver != user:
+    if friend_request.receiver_id != user.id:
         return JsonResponse({'error': 'This is not your friend request to accept'}, status=403)
     
     if not friend_request.is_active:
         return JsonResponse({'error': 'Friend request is not active'}, status=400)
     
     try:
-        friend_request.accept()
-        
-        # Create a chat room between the two users
-        from chat.models import Room, Chat
-        room = Room.objects.filter(
-            Q(author=user, friend=friend_request.sender) | Q(author=friend_request.sender, friend=user)
-        )
-        if not room.exists():
-            room = Room(author=user, friend=friend_request.sender)
-            room.save()
-        else:
-            room = room.first()
-        
-        # Send initial "Say hi" message
-        # initial_message = Chat.objects.create(
-        #     room_id=room,
-        #     author=user,
-        #     friend=friend_request.sender,
-        #     text="Say hi! 👋"
-        # )
-        
-        # Create notification for the sender that their friend request was accepted
-        Notification.objects.create(
-            sender=user,
-            user=friend_request.sender,
-            notification_type=8,  # Friend Request Accepted
-            text_preview=f'{user.username} accepted your friend request',
-        )
+        # Friendship, chat room and notification land together or not at all;
+        # the request accept() claimed stays claimed until this block commits
+        with transaction.atomic():
+            if not friend_request.accept():
+                return JsonResponse({'error': 'Friend request is not active'}, status=400)
+
+            sender_id = friend_request.sender_id
+            room = Room.objects.filter(
+                Q(author=user, friend_id=sender_id) | Q(author_id=sender_id, friend=user)
+            ).first()
+            if room is None:
+                room = Room.objects.create(author=user, friend_id=sender_id)
+
+            # Tell the sender their friend request was accepted
+            Notification.objects.create(
+                sender=user,
+                user_id=sender_id,
+                notification_type=8,  # Friend Request Accepted
+                text_preview=f'{user.username} accepted your friend request',
+            )
         
         return JsonResponse({
             'success': True,
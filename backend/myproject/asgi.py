@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 """
 
+import logging
 import os
 
 from django.core.asgi import get_asgi_application
@@ -14,3 +15,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
 application = get_asgi_application()
+
+# Daphne doesn't run system checks, so repeat the multi-worker one here
+from chat.checks import check_shared_cache
+
+for warning in check_shared_cache(None):
+    logging.getLogger(__name__).warning('%s %s (%s)', warning.msg, warning.hint, warning.id)
@@ -102,6 +102,7 @@ INSTALLED_APPS = [
     'channels',
     'friend',
     'videocall',
+    'search',
 ]
 
 MIDDLEWARE = [
@@ -278,11 +279,84 @@ MESSAGE_TAGS = {
 
 ASGI_APPLICATION = "myproject.routing.application"
 
-CHANNEL_LAYERS = {
-    "default":{
-        "BACKEND":"channels.layers.InMemoryChannelLayer"
-    },
-}
+# Channel layers
+# The in-memory layer only works inside a single process. To run several
+# Daphne workers (and the chatworker) against shared groups, set
+# CHANNEL_LAYER_BACKEND=redis (or redis-pubsub) and list one or more Redis
+# URLs in CHANNEL_REDIS_URLS; channels and groups are sharded across them.
+# `python manage.py channel_layer_standin` starts a local Redis stand-in.
+CHANNEL_LAYER_BACKEND = os.getenv('CHANNEL_LAYER_BACKEND', 'memory').lower()
+CHANNEL_REDIS_URLS = [
+    url.strip() for url in os.getenv('CHANNEL_REDIS_URLS', 'redis://127.0.0.1:6379/0').split(',') if url.strip()
+]
+
+if CHANNEL_LAYER_BACKEND == 'redis':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": CHANNEL_REDIS_URLS,
+                "prefix": os.getenv('CHANNEL_PREFIX', 'ghosttalk'),
+                "capacity": int(os.getenv('CHANNEL_CAPACITY', 100)),
+                "expiry": int(os.getenv('CHANNEL_EXPIRY', 60)),
+                "group_expiry": int(os.getenv('CHANNEL_GROUP_EXPIRY', 86400)),
+            },
+        },
+    }
+elif CHANNEL_LAYER_BACKEND == 'redis-pubsub':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {
+                "hosts": CHANNEL_REDIS_URLS,
+                "prefix": os.getenv('CHANNEL_PREFIX', 'ghosttalk'),
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {
+                "capacity": int(os.getenv('CHANNEL_CAPACITY', 100)),
+                "expiry": int(os.getenv('CHANNEL_EXPIRY', 60)),
+                "group_expiry": int(os.getenv('CHANNEL_GROUP_EXPIRY', 86400)),
+            },
+        },
+    }
+
+# Cache
+# Local memory by default; set CACHE_REDIS_URL so presence and other cached
+# state is shared by every worker process. Presence gets its own alias so
+# socket counts are never culled to make room for ordinary cache entries.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        },
+        'presence': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        },
+        'presence': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'presence',
+            'OPTIONS': {'MAX_ENTRIES': 300000},
+        },
+    }
+
+# Presence (see users/presence.py)
+PRESENCE_HEARTBEAT_TTL = int(os.getenv('PRESENCE_HEARTBEAT_TTL', 90))
+PRESENCE_OFFLINE_GRACE = int(os.getenv('PRESENCE_OFFLINE_GRACE', 10))
 
 SITE_ID = 2     # considering 2nd site in 'Sites' to be 127.0.0.1 (for dev)
 
@@ -327,6 +401,12 @@ REST_FRAMEWORK = {
     ],
 }
 
+# API tokens expire after TOKEN_EXPIRY_SECONDS; token lookups are cached
+# per process for TOKEN_CACHE_TTL seconds (see users/authentication.py)
+TOKEN_EXPIRY_SECONDS = int(os.getenv('TOKEN_EXPIRY_SECONDS', 86400))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 1024))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 60))
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_comment_post_reply_id_idx'),
+        ('notification', '0005_alter_notification_notification_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_seen', 'date'], name='notification_user_seen_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+ROLLUP_SAMPLE = 10
+
+
+def merge_duplicate_rollups(apps, schema_editor):
+    """Fold post-less rollups sharing (user, type, bucket) into the newest one"""
+    Notification = apps.get_model('notification', 'Notification')
+    rollups = Notification.objects.filter(post__isnull=True, bucket__isnull=False)
+    duplicates = (
+        rollups.values('user_id', 'notification_type', 'bucket')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        keep, *others = rollups.filter(
+            user_id=row['user_id'], notification_type=row['notification_type'], bucket=row['bucket']
+        ).order_by('-date', '-id')
+        for other in others:
+            new_actors = [actor for actor in other.actors if actor not in keep.actors]
+            # Actors beyond either sample can't be matched up, so count them once each
+            keep.actor_count += other.actor_count - (len(other.actors) - len(new_actors))
+            keep.actors = (keep.actors + new_actors)[:ROLLUP_SAMPLE]
+            keep.is_seen = keep.is_seen and other.is_seen
+            other.delete()
+        keep.save(update_fields=['actors', 'actor_count', 'is_seen'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0007_notification_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('post__isnull', True)), fields=('user', 'notification_type', 'bucket'), name='unique_notification_rollup_no_post'),
+        ),
+    ]
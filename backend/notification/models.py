@@ -14,6 +14,27 @@ class Notification(models.Model):
     text_preview = models.CharField(max_length=120, blank=True)
     date = models.DateTimeField(auto_now_add=True)
     is_seen = models.BooleanField(default=False)
+    # Rollups (see notification.rollup): one row per (user, post, type, bucket)
+    # where `sender` is the latest actor, `actors` a capped sample of actor
+    # ids (newest first) and `actor_count` how many acted in the bucket
+    bucket = models.DateTimeField(blank=True, null=True)
+    actor_count = models.PositiveIntegerField(default=1)
+    actors = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post', 'notification_type', 'bucket'], name='unique_notification_rollup'),
+            # NULLs are distinct in the one above, so rollups without a post need their own
+            models.UniqueConstraint(
+                fields=['user', 'notification_type', 'bucket'],
+                condition=models.Q(post__isnull=True),
+                name='unique_notification_rollup_no_post',
+            ),
+        ]
+        indexes = [
+            # Feed pages and unread counts for one recipient
+            models.Index(fields=['user', 'is_seen', 'date'], name='notification_user_seen_idx'),
+        ]
 
     def __str__(self):
         return '%s - %s - %s - %s - %s' %(self.id, self.post, self.sender, self.user, self.notification_type)
\ No newline at end of file
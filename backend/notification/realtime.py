@@ -0,0 +1,55 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+
+from . import unread
+
+
+logger = logging.getLogger(__name__)
+
+
+def notification_group(user_id):
+    """Channel group a user's notification sockets listen on"""
+    return f'notifications_{user_id}'
+
+
+def serialize_notifications(notifications):
+    """Serialize notifications, resolving every rollup's actor sample in one query"""
+    notifications = list(notifications)
+    actor_ids = {actor_id for n in notifications for actor_id in n.actors}
+    usernames = dict(User.objects.filter(id__in=actor_ids).values_list('id', 'username')) if actor_ids else {}
+    return [{
+        'id': n.id,
+        'sender': n.sender.username,
+        'sender_id': n.sender_id,
+        'sender_first_name': n.sender.first_name,
+        'sender_last_name': n.sender.last_name,
+        'notification_type': n.notification_type,
+        'text_preview': n.text_preview,
+        'date': n.date.isoformat(),
+        'post_id': n.post_id,
+        'is_seen': n.is_seen,
+        'actor_count': n.actor_count,
+        'actors': [usernames[actor_id] for actor_id in n.actors if actor_id in usernames],
+    } for n in notifications]
+
+
+def serialize_notification(n):
+    return serialize_notifications([n])[0]
+
+
+def push_notification(notification):
+    """Push a new notification to its recipient's open sockets"""
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            notification_group(notification.user_id),
+            {
+                'type': 'notification_event',
+                'notification': serialize_notification(notification),
+                'unread_count': unread.unread_count(notification.user_id),
+            }
+        )
+    except Exception as e:
+        logger.warning(f'Could not push notification {notification.id}: {str(e)}')
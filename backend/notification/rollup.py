@@ -0,0 +1,89 @@
+"""
+Notification rollups.
+
+Likes don't get a notification row each. They are folded into one row per
+(recipient, post, type, ROLLUP_BUCKET time bucket) holding how many people
+acted, the latest of them as `sender` and the ids of the ROLLUP_SAMPLE most
+recent. A new actor brings the row back to the top of the feed as unseen.
+
+Withdrawing (unlike) takes the actor out of the rollup whose sample holds
+them. Someone who already dropped out of the sample can't be located, so
+their unlike leaves the count as it was; with a sample of ten this only
+blurs the numbers on very busy posts.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification
+from . import realtime, unread
+
+
+ROLLUP_TYPES = {1, 5, 6}  # Like, Like-Comment, Like-Reply
+ROLLUP_BUCKET = timedelta(hours=6)
+ROLLUP_SAMPLE = 10
+
+
+def bucket_for(when):
+    """Start of the bucket `when` falls in"""
+    size = ROLLUP_BUCKET.total_seconds()
+    seconds = when.timestamp()
+    return datetime.fromtimestamp(seconds - seconds % size, tz=dt_timezone.utc)
+
+
+def record(recipient_id, actor, notification_type, post_id=None, text_preview=''):
+    """Create a notification, or fold it into the current rollup for its type"""
+    if notification_type not in ROLLUP_TYPES:
+        return Notification.objects.create(
+            user_id=recipient_id, sender=actor, notification_type=notification_type,
+            post_id=post_id, text_preview=text_preview,
+        )
+
+    now = timezone.now()
+    with transaction.atomic():
+        rollup, created = Notification.objects.select_for_update().get_or_create(
+            user_id=recipient_id, post_id=post_id, notification_type=notification_type, bucket=bucket_for(now),
+            defaults={'sender': actor, 'actors': [actor.id], 'text_preview': text_preview},
+        )
+        if created:
+            return rollup
+
+        if actor.id in rollup.actors:
+            rollup.actors.remove(actor.id)  # already counted, just move to the front
+        else:
+            rollup.actor_count += 1
+        rollup.actors = [actor.id] + rollup.actors[:ROLLUP_SAMPLE - 1]
+        was_seen = rollup.is_seen
+        rollup.sender = actor
+        rollup.is_seen = False
+        rollup.date = now
+        rollup.save(update_fields=['sender', 'actors', 'actor_count', 'is_seen', 'date'])
+
+    if was_seen:
+        unread.adjust(recipient_id, 1)
+    transaction.on_commit(lambda: realtime.push_notification(rollup))
+    return rollup
+
+
+def withdraw(recipient_id, actor_id, notification_type, post_id=None):
+    """Undo `record` for an actor (unlike, unfollow)"""
+    notifications = Notification.objects.filter(user_id=recipient_id, post_id=post_id, notification_type=notification_type)
+    # Plain rows, and rollable ones written before rollups existed
+    notifications.filter(sender_id=actor_id, bucket=None).delete()
+    if notification_type not in ROLLUP_TYPES:
+        return
+
+    with transaction.atomic():
+        for rollup in notifications.select_for_update().exclude(bucket=None).order_by('-bucket'):
+            if actor_id not in rollup.actors:
+                continue
+            if rollup.actor_count <= 1:
+                rollup.delete()
+                return
+            rollup.actors.remove(actor_id)
+            rollup.actor_count -= 1
+            if rollup.sender_id == actor_id and rollup.actors:
+                rollup.sender_id = rollup.actors[0]
+            rollup.save(update_fields=['sender', 'actors', 'actor_count'])
+            return
@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Notification
+from . import realtime, unread
+
+
+""" Counting and pushing new notifications """
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, **kwargs):
+    if created and not instance.is_seen:
+        unread.adjust(instance.user_id, 1)
+    if created:
+        transaction.on_commit(lambda: realtime.push_notification(instance))
+
+
+""" Uncounting unread notifications that are withdrawn (unlike, unfollow) """
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.is_seen:
+        unread.adjust(instance.user_id, -1)
@@ -1,3 +1,115 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from rest_framework.authtoken.models import Token
 
-# Create your tests here.
+from blog.models import Post
+from notification import rollup, unread
+from notification.models import Notification
+from notification.views import get_notifications
+
+
+def make_user(username):
+    return User.objects.create_user(username, f'{username}@example.com', 'pw')
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.fans = [make_user(f'fan{i}') for i in range(3)]
+        self.post = Post.objects.create(title='Hello', content='World', author=self.author)
+
+    def _like(self, fan):
+        return rollup.record(self.author.id, fan, 1, post_id=self.post.id)
+
+    def test_likes_fold_into_one_row(self):
+        for fan in self.fans:
+            self._like(fan)
+        self._like(self.fans[0])  # liking again moves them to the front
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.actors, [self.fans[0].id, self.fans[2].id, self.fans[1].id])
+        self.assertEqual(notification.sender, self.fans[0])
+
+    def test_new_actor_brings_seen_rollup_back_as_unread(self):
+        self._like(self.fans[0])
+        Notification.objects.update(is_seen=True)
+        unread.reset(self.author.id)
+        self._like(self.fans[1])
+        self.assertFalse(Notification.objects.get().is_seen)
+        self.assertEqual(unread.unread_count(self.author.id), 1)
+
+    def test_withdraw_takes_actor_out(self):
+        for fan in self.fans[:2]:
+            self._like(fan)
+        rollup.withdraw(self.author.id, self.fans[1].id, 1, post_id=self.post.id)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor_count, notification.actors), (1, [self.fans[0].id]))
+        self.assertEqual(notification.sender, self.fans[0])
+        rollup.withdraw(self.author.id, self.fans[0].id, 1, post_id=self.post.id)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_other_types_get_a_row_each(self):
+        rollup.record(self.author.id, self.fans[0], 2)
+        rollup.record(self.author.id, self.fans[1], 2)
+        self.assertEqual(Notification.objects.filter(notification_type=2).count(), 2)
+        rollup.withdraw(self.author.id, self.fans[0].id, 2)
+        self.assertEqual(list(Notification.objects.values_list('sender_id', flat=True)), [self.fans[1].id])
+
+    def test_rollups_without_a_post_are_unique(self):
+        first = rollup.record(self.author.id, self.fans[0], 5)
+        rollup.record(self.author.id, self.fans[1], 5)
+        self.assertEqual(Notification.objects.get().actor_count, 2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Notification.objects.create(
+                user=self.author, sender=self.fans[2], notification_type=5, bucket=first.bucket
+            )
+
+
+class NotificationFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('reader')
+        self.sender = make_user('sender')
+        self.notifications = [
+            Notification.objects.create(user=self.user, sender=self.sender, notification_type=2) for _ in range(5)
+        ]
+        # Two notifications in the same instant: ties break on id
+        Notification.objects.filter(pk__in=[n.pk for n in self.notifications[1:3]]).update(
+            date=self.notifications[1].date
+        )
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def test_pages_walk_newest_first_without_gaps(self):
+        seen, before = [], None
+        while True:
+            params = {'limit': 2, **({'before': before} if before else {})}
+            page = self.client.get('/notifications/', params, **self.headers).json()
+            seen += [n['id'] for n in page['notifications']]
+            before = page['next_before']
+            if not page['has_more']:
+                break
+        expected = Notification.objects.order_by('-date', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+        self.assertEqual(len(seen), 5)
+
+    def test_unseen_only(self):
+        Notification.objects.filter(pk=self.notifications[4].pk).update(is_seen=True)
+        page, has_more = get_notifications(self.user.id, unseen_only=True, limit=10)
+        self.assertNotIn(self.notifications[4], page)
+        self.assertEqual((len(page), has_more), (4, False))
+
+    def test_cursor_from_another_user_returns_nothing(self):
+        other = Notification.objects.create(user=self.sender, sender=self.user, notification_type=2)
+        self.assertEqual(get_notifications(self.user.id, before=other.id), ([], False))
+
+    def test_marking_read_keeps_unread_count_in_step(self):
+        self.assertEqual(self.client.get('/notifications/unread-count/', **self.headers).json()['unread_count'], 5)
+        url = f'/notifications/{self.notifications[0].pk}/read/'
+        self.client.post(url, **self.headers)
+        self.client.post(url, **self.headers)
+        self.assertEqual(unread.unread_count(self.user.id), 4)
+        self.client.post('/notifications/mark-all-read/', **self.headers)
+        self.assertEqual(unread.unread_count(self.user.id), 0)
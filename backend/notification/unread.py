@@ -0,0 +1,38 @@
+"""
+Cached unread-notification counters.
+
+The badge count lives in the Django cache and is adjusted as notifications
+are created, deleted or marked read, so polling it never counts rows. A
+missing or expired counter is recomputed from the (user, is_seen, date)
+index; the TTL bounds how long any drift can survive.
+"""
+from django.core.cache import cache
+
+from .models import Notification
+
+
+UNREAD_TTL = 60 * 60
+
+
+def _key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def unread_count(user_id):
+    count = cache.get(_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, is_seen=False).count()
+        cache.add(_key(user_id), count, UNREAD_TTL)
+    return max(count, 0)
+
+
+def adjust(user_id, delta):
+    """Shift a cached counter; an uncached one is simply counted on next read"""
+    try:
+        cache.incr(_key(user_id), delta)
+    except ValueError:
+        pass
+
+
+def reset(user_id):
+    cache.set(_key(user_id), 0, UNREAD_TTL)
@@ -1,8 +1,9 @@
 from django.urls import path
-from notification.views import ShowNotifications, MarkNotificationRead, MarkAllNotificationsRead
+from notification.views import ShowNotifications, UnreadNotificationCount, MarkNotificationRead, MarkAllNotificationsRead
 
 urlpatterns = [
     path('', ShowNotifications, name='show-notifications'),
+    path('unread-count/', UnreadNotificationCount, name='unread-notification-count'),
     path('<int:notification_id>/read/', MarkNotificationRead, name='mark-notification-read'),
     path('mark-all-read/', MarkAllNotificationsRead, name='mark-all-notifications-read'),
-]
\ No newline at end of file
+]
@@ -1,6 +1,9 @@
 from django.contrib.auth.decorators import login_required
+from django.db.models import Q, Subquery
 from django.http import JsonResponse
 from notification.models import Notification
+from notification import unread
+from notification.realtime import serialize_notifications
 from users.views import token_required
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -8,44 +11,62 @@ import json
 
 # Create your views here.
 
-""" All notifications """
+NOTIFICATION_PAGE_SIZE = 20
+NOTIFICATION_MAX_PAGE_SIZE = 100
+
+
+def get_notifications(user_id, before=None, unseen_only=False, limit=NOTIFICATION_PAGE_SIZE):
+    """
+    Keyset page of a user's notifications, newest first, older than
+    notification `before`. Returns (notifications, has_more).
+    """
+    notifications = Notification.objects.filter(user_id=user_id).select_related('sender')
+    if unseen_only:
+        notifications = notifications.filter(is_seen=False)
+    if before:
+        anchor_date = Subquery(Notification.objects.filter(pk=before, user_id=user_id).values('date')[:1])
+        notifications = notifications.filter(Q(date__lt=anchor_date) | Q(date=anchor_date, id__lt=before))
+    page = list(notifications.order_by('-date', '-id')[:limit + 1])
+    return page[:limit], len(page) > limit
+
+
+""" Notifications, newest first """
 @token_required
 def ShowNotifications(request):
-    user = request.user
-    notifications = Notification.objects.filter(user=user).order_by('-date')
-
-    notification_data = []
-    for n in notifications:
-        data = {
-            'id': n.id,
-            'sender': n.sender.username if n.sender else None,
-            'sender_id': n.sender.id if n.sender else None,
-            'sender_first_name': n.sender.first_name if n.sender else None,
-            'sender_last_name': n.sender.last_name if n.sender else None,
-            'notification_type': n.notification_type,
-            'text_preview': n.text_preview,
-            'date': n.date.isoformat(),
-            'post_id': n.post_id,
-            'is_seen': n.is_seen,
-        }
-        notification_data.append(data)
+    """Pass the last notification id as ?before= for the next page; ?unseen=1 for unread only"""
+    try:
+        before = int(request.GET.get('before', 0)) or None
+        limit = int(request.GET.get('limit', NOTIFICATION_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+    limit = max(1, min(limit, NOTIFICATION_MAX_PAGE_SIZE))
+    unseen_only = request.GET.get('unseen') in ('1', 'true')
+
+    notifications, has_more = get_notifications(request.user.id, before=before, unseen_only=unseen_only, limit=limit)
 
     return JsonResponse({
-        'notifications': notification_data
+        'notifications': serialize_notifications(notifications),
+        'has_more': has_more,
+        'next_before': notifications[-1].id if notifications and has_more else None,
+        'unread_count': unread.unread_count(request.user.id),
     })
 
+""" Unread notification count for the app badge """
+@token_required
+def UnreadNotificationCount(request):
+    return JsonResponse({'unread_count': unread.unread_count(request.user.id)})
+
 """ Mark notification as read """
 @csrf_exempt
 @token_required
 def MarkNotificationRead(request, notification_id):
     if request.method == 'POST':
-        try:
-            notification = Notification.objects.get(id=notification_id, user=request.user)
-            notification.is_seen = True
-            notification.save()
-            return JsonResponse({'success': True, 'message': 'Notification marked as read'})
-        except Notification.DoesNotExist:
+        notifications = Notification.objects.filter(id=notification_id, user=request.user)
+        if notifications.filter(is_seen=False).update(is_seen=True):
+            unread.adjust(request.user.id, -1)
+        elif not notifications.exists():
             return JsonResponse({'success': False, 'message': 'Notification not found'}, status=404)
+        return JsonResponse({'success': True, 'message': 'Notification marked as read'})
     return JsonResponse({'success': False, 'message': 'Invalid request method'}, status=400)
 
 """ Mark all notifications as read """
@@ -54,5 +75,6 @@ def MarkNotificationRead(request, notification_id):
 def MarkAllNotificationsRead(request):
     if request.method == 'POST':
         Notification.objects.filter(user=request.user, is_seen=False).update(is_seen=True)
+        unread.reset(request.user.id)
         return JsonResponse({'success': True, 'message': 'All notifications marked as read'})
-    return JsonResponse({'success': False, 'message': 'Invalid request method'}, status=400)
\ No newline at end of file
+    return JsonResponse({'success': False, 'message': 'Invalid request method'}, status=400)
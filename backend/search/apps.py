@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+class SearchConfig(AppConfig):
+    name = 'search'
+
+    def ready(self):
+        import search.signals
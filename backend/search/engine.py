@@ -0,0 +1,375 @@
+"""
+Full-text search over posts and users.
+
+Documents live in a dedicated inverted index that is updated from signals
+whenever a post, user or profile is written:
+
+* SQLite: FTS5 virtual tables ranked with bm25, prefix indexes on 2 and 3
+  character terms.
+* PostgreSQL: tsvector documents with GIN indexes, ranked with ts_rank_cd,
+  plus pg_trgm similarity on titles/names so typos still find something.
+* Anything else (or SQLite built without FTS5): the old icontains scan.
+
+Every query term is matched as a prefix, all terms must match, and results
+come back as ranked id pages.
+"""
+import logging
+import re
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError, OperationalError, connection, transaction
+from django.db.models import Q
+
+from blog.models import Post
+from users.models import Profile
+
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+MAX_QUERY_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def query_terms(query):
+    """Word tokens of a raw query, lowercased and capped"""
+    return [t.lower() for t in _TERM_RE.findall(query or '')][:MAX_QUERY_TERMS]
+
+
+def _tables():
+    return {
+        'post': Post._meta.db_table,
+        'user': User._meta.db_table,
+        'profile': Profile._meta.db_table,
+    }
+
+
+class SQLiteBackend:
+    post_table = 'search_post_fts'
+    user_table = 'search_user_fts'
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.post_table} USING fts5("
+            "title, body, author, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.user_table} USING fts5("
+            "username, first_name, last_name, bio, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.post_table}')
+        cursor.execute(f'DROP TABLE IF EXISTS {self.user_table}')
+
+    def rebuild(self, cursor):
+        t = _tables()
+        cursor.execute(f'DELETE FROM {self.post_table}')
+        cursor.execute(
+            f"INSERT INTO {self.post_table} (rowid, title, body, author) "
+            f"SELECT p.id, p.title, COALESCE(p.content, ''), u.username "
+            f"FROM {t['post']} p JOIN {t['user']} u ON u.id = p.author_id"
+        )
+        cursor.execute(f'DELETE FROM {self.user_table}')
+        cursor.execute(
+            f"INSERT INTO {self.user_table} (rowid, username, first_name, last_name, bio) "
+            f"SELECT u.id, u.username, u.first_name, u.last_name, COALESCE(pr.bio, '') "
+            f"FROM {t['user']} u LEFT JOIN {t['profile']} pr ON pr.user_id = u.id"
+        )
+
+    def index_post(self, cursor, post_id, title, body, author):
+        cursor.execute(f'DELETE FROM {self.post_table} WHERE rowid = %s', [post_id])
+        cursor.execute(
+            f'INSERT INTO {self.post_table} (rowid, title, body, author) VALUES (%s, %s, %s, %s)',
+            [post_id, title, body, author],
+        )
+
+    def remove_post(self, cursor, post_id):
+        cursor.execute(f'DELETE FROM {self.post_table} WHERE rowid = %s', [post_id])
+
+    def rename_author(self, cursor, author_id, username):
+        cursor.execute(
+            f"UPDATE {self.post_table} SET author = %s "
+            f"WHERE rowid IN (SELECT id FROM {_tables()['post']} WHERE author_id = %s)",
+            [username, author_id],
+        )
+
+    def index_user(self, cursor, user_id, username, first_name, last_name, bio):
+        cursor.execute(f'DELETE FROM {self.user_table} WHERE rowid = %s', [user_id])
+        cursor.execute(
+            f'INSERT INTO {self.user_table} (rowid, username, first_name, last_name, bio) '
+            f'VALUES (%s, %s, %s, %s, %s)',
+            [user_id, username, first_name, last_name, bio],
+        )
+
+    def remove_user(self, cursor, user_id):
+        cursor.execute(f'DELETE FROM {self.user_table} WHERE rowid = %s', [user_id])
+
+    def _match(self, terms):
+        # Each term quoted (so FTS5 syntax in user input is inert) and prefix-matched
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search_posts(self, cursor, terms, limit, offset):
+        cursor.execute(
+            f'SELECT rowid FROM {self.post_table} WHERE {self.post_table} MATCH %s '
+            f'ORDER BY bm25({self.post_table}, 10.0, 1.0, 5.0), rowid DESC LIMIT %s OFFSET %s',
+            [self._match(terms), limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def search_users(self, cursor, terms, limit, offset, exclude_id=None):
+        cursor.execute(
+            f'SELECT rowid FROM {self.user_table} WHERE {self.user_table} MATCH %s AND rowid != %s '
+            f'ORDER BY bm25({self.user_table}, 10.0, 5.0, 5.0, 1.0), rowid LIMIT %s OFFSET %s',
+            [self._match(terms), exclude_id or 0, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresBackend:
+    post_table = 'search_post_index'
+    user_table = 'search_user_index'
+
+    # Weighted documents: A = title/username, B = names, C = body/bio
+    POST_DOCUMENT = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'C') || "
+        "setweight(to_tsvector('simple', %s), 'B')"
+    )
+    USER_DOCUMENT = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'C')"
+    )
+
+    def create(self, cursor):
+        t = _tables()
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.post_table} ("
+            f"post_id bigint PRIMARY KEY REFERENCES {t['post']} (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            f"document tsvector NOT NULL, title text NOT NULL)"
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS search_post_document_idx ON {self.post_table} USING GIN (document)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS search_post_title_trgm_idx ON {self.post_table} USING GIN (title gin_trgm_ops)')
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.user_table} ("
+            f"user_id integer PRIMARY KEY REFERENCES {t['user']} (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            f"document tsvector NOT NULL, names text NOT NULL)"
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS search_user_document_idx ON {self.user_table} USING GIN (document)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS search_user_names_trgm_idx ON {self.user_table} USING GIN (names gin_trgm_ops)')
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.post_table}')
+        cursor.execute(f'DROP TABLE IF EXISTS {self.user_table}')
+
+    def rebuild(self, cursor):
+        t = _tables()
+        cursor.execute(f'TRUNCATE {self.post_table}')
+        cursor.execute(
+            f"INSERT INTO {self.post_table} (post_id, document, title) "
+            f"SELECT p.id, "
+            f"setweight(to_tsvector('simple', p.title), 'A') || "
+            f"setweight(to_tsvector('simple', COALESCE(p.content, '')), 'C') || "
+            f"setweight(to_tsvector('simple', u.username), 'B'), p.title "
+            f"FROM {t['post']} p JOIN {t['user']} u ON u.id = p.author_id"
+        )
+        cursor.execute(f'TRUNCATE {self.user_table}')
+        cursor.execute(
+            f"INSERT INTO {self.user_table} (user_id, document, names) "
+            f"SELECT u.id, "
+            f"setweight(to_tsvector('simple', u.username), 'A') || "
+            f"setweight(to_tsvector('simple', u.first_name), 'B') || "
+            f"setweight(to_tsvector('simple', u.last_name), 'B') || "
+            f"setweight(to_tsvector('simple', COALESCE(pr.bio, '')), 'C'), "
+            f"concat_ws(' ', u.username, u.first_name, u.last_name) "
+            f"FROM {t['user']} u LEFT JOIN {t['profile']} pr ON pr.user_id = u.id"
+        )
+
+    def index_post(self, cursor, post_id, title, body, author):
+        cursor.execute(
+            f'INSERT INTO {self.post_table} (post_id, document, title) VALUES (%s, {self.POST_DOCUMENT}, %s) '
+            f'ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document, title = EXCLUDED.title',
+            [post_id, title, body, author, title],
+        )
+
+    def remove_post(self, cursor, post_id):
+        cursor.execute(f'DELETE FROM {self.post_table} WHERE post_id = %s', [post_id])
+
+    def rename_author(self, cursor, author_id, username):
+        # The author's name is folded into each document, so rebuild them
+        t = _tables()
+        cursor.execute(
+            f"UPDATE {self.post_table} s SET document = "
+            f"setweight(to_tsvector('simple', p.title), 'A') || "
+            f"setweight(to_tsvector('simple', COALESCE(p.content, '')), 'C') || "
+            f"setweight(to_tsvector('simple', %s), 'B') "
+            f"FROM {t['post']} p WHERE p.id = s.post_id AND p.author_id = %s",
+            [username, author_id],
+        )
+
+    def index_user(self, cursor, user_id, username, first_name, last_name, bio):
+        names = ' '.join(part for part in (username, first_name, last_name) if part)
+        cursor.execute(
+            f'INSERT INTO {self.user_table} (user_id, document, names) VALUES (%s, {self.USER_DOCUMENT}, %s) '
+            f'ON CONFLICT (user_id) DO UPDATE SET document = EXCLUDED.document, names = EXCLUDED.names',
+            [user_id, username, first_name, last_name, bio, names],
+        )
+
+    def remove_user(self, cursor, user_id):
+        cursor.execute(f'DELETE FROM {self.user_table} WHERE user_id = %s', [user_id])
+
+    def _tsquery(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def search_posts(self, cursor, terms, limit, offset):
+        raw = ' '.join(terms)
+        cursor.execute(
+            f"SELECT post_id FROM {self.post_table}, to_tsquery('simple', %s) q "
+            f"WHERE document @@ q OR title %% %s "
+            f"ORDER BY ts_rank_cd(document, q) + similarity(title, %s) DESC, post_id DESC "
+            f"LIMIT %s OFFSET %s",
+            [self._tsquery(terms), raw, raw, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def search_users(self, cursor, terms, limit, offset, exclude_id=None):
+        raw = ' '.join(terms)
+        cursor.execute(
+            f"SELECT user_id FROM {self.user_table}, to_tsquery('simple', %s) q "
+            f"WHERE (document @@ q OR names %% %s) AND user_id != %s "
+            f"ORDER BY ts_rank_cd(document, q) + similarity(names, %s) DESC, user_id "
+            f"LIMIT %s OFFSET %s",
+            [self._tsquery(terms), raw, exclude_id or 0, raw, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class ScanBackend:
+    """No index: substring scans through the ORM, as search used to work"""
+
+    def create(self, cursor):
+        pass
+
+    def drop(self, cursor):
+        pass
+
+    def rebuild(self, cursor):
+        pass
+
+    def index_post(self, cursor, *args):
+        pass
+
+    def remove_post(self, cursor, post_id):
+        pass
+
+    def rename_author(self, cursor, author_id, username):
+        pass
+
+    def index_user(self, cursor, *args):
+        pass
+
+    def remove_user(self, cursor, user_id):
+        pass
+
+    def search_posts(self, cursor, terms, limit, offset):
+        posts = Post.objects.all()
+        for term in terms:
+            posts = posts.filter(Q(title__icontains=term) | Q(author__username__iexact=term))
+        return list(posts.order_by('-id').values_list('id', flat=True)[offset:offset + limit])
+
+    def search_users(self, cursor, terms, limit, offset, exclude_id=None):
+        users = User.objects.exclude(id=exclude_id)
+        for term in terms:
+            users = users.filter(
+                Q(username__icontains=term) | Q(first_name__icontains=term) | Q(last_name__icontains=term)
+            )
+        return list(users.order_by('id').values_list('id', flat=True)[offset:offset + limit])
+
+
+def _sqlite_has_fts5(conn):
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.search_fts5_probe USING fts5(x)')
+        except OperationalError:
+            return False
+        cursor.execute('DROP TABLE temp.search_fts5_probe')
+        return True
+
+
+def backend_for(conn):
+    if conn.vendor == 'postgresql':
+        return PostgresBackend()
+    if conn.vendor == 'sqlite' and _sqlite_has_fts5(conn):
+        return SQLiteBackend()
+    return ScanBackend()
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = backend_for(connection)
+    return _backend
+
+
+def _write(method, *args):
+    """Apply an index update; a failed index write must never fail the save"""
+    try:
+        # The savepoint keeps a failure from aborting the caller's transaction
+        with transaction.atomic(), connection.cursor() as cursor:
+            getattr(get_backend(), method)(cursor, *args)
+    except DatabaseError as e:
+        logger.error(f'Search index {method} failed: {str(e)}')
+
+
+def index_post(post):
+    author = User.objects.filter(pk=post.author_id).values_list('username', flat=True).first() or ''
+    _write('index_post', post.pk, post.title or '', post.content or '', author)
+
+
+def remove_post(post_id):
+    _write('remove_post', post_id)
+
+
+def rename_author(user):
+    _write('rename_author', user.pk, user.username)
+
+
+def index_user(user, bio=''):
+    _write('index_user', user.pk, user.username, user.first_name or '', user.last_name or '', bio or '')
+
+
+def remove_user(user_id):
+    _write('remove_user', user_id)
+
+
+def rebuild():
+    with connection.cursor() as cursor:
+        get_backend().rebuild(cursor)
+
+
+def _page(search, query, page, limit, **kwargs):
+    terms = query_terms(query)
+    if not terms:
+        return [], False
+    offset = (page - 1) * limit
+    with connection.cursor() as cursor:
+        ids = search(cursor, terms, limit + 1, offset, **kwargs)
+    return ids[:limit], len(ids) > limit
+
+
+def search_posts(query, page=1, limit=SEARCH_PAGE_SIZE):
+    """Ranked page of post ids matching `query`. Returns (post_ids, has_more)"""
+    return _page(get_backend().search_posts, query, page, limit)
+
+
+def search_users(query, page=1, limit=SEARCH_PAGE_SIZE, exclude_id=None):
+    """Ranked page of user ids matching `query`. Returns (user_ids, has_more)"""
+    return _page(get_backend().search_users, query, page, limit, exclude_id=exclude_id)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from search import engine
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for posts and users from scratch'
+
+    def handle(self, *args, **options):
+        engine.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index ({type(engine.get_backend()).__name__})'))
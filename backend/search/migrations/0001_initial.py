@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.db import OperationalError, migrations
+
+
+# The DDL is frozen here rather than imported from search.engine, so later
+# changes to the engine can't change what this migration does. Source table
+# names come from the historical models.
+
+SQLITE_POST_TABLE = 'search_post_fts'
+SQLITE_USER_TABLE = 'search_user_fts'
+POSTGRES_POST_TABLE = 'search_post_index'
+POSTGRES_USER_TABLE = 'search_user_index'
+
+
+def _tables(apps):
+    return {
+        'post': apps.get_model('blog', 'Post')._meta.db_table,
+        'user': apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table,
+        'profile': apps.get_model('users', 'Profile')._meta.db_table,
+    }
+
+
+def _sqlite_has_fts5(cursor):
+    try:
+        cursor.execute('CREATE VIRTUAL TABLE temp.search_fts5_probe USING fts5(x)')
+    except OperationalError:
+        return False
+    cursor.execute('DROP TABLE temp.search_fts5_probe')
+    return True
+
+
+def _create_sqlite(cursor, t):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_POST_TABLE} USING fts5("
+        "title, body, author, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_USER_TABLE} USING fts5("
+        "username, first_name, last_name, bio, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    cursor.execute(
+        f"INSERT INTO {SQLITE_POST_TABLE} (rowid, title, body, author) "
+        f"SELECT p.id, p.title, COALESCE(p.content, ''), u.username "
+        f"FROM {t['post']} p JOIN {t['user']} u ON u.id = p.author_id"
+    )
+    cursor.execute(
+        f"INSERT INTO {SQLITE_USER_TABLE} (rowid, username, first_name, last_name, bio) "
+        f"SELECT u.id, u.username, u.first_name, u.last_name, COALESCE(pr.bio, '') "
+        f"FROM {t['user']} u LEFT JOIN {t['profile']} pr ON pr.user_id = u.id"
+    )
+
+
+def _create_postgres(cursor, t):
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {POSTGRES_POST_TABLE} ("
+        f"post_id bigint PRIMARY KEY REFERENCES {t['post']} (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        f"document tsvector NOT NULL, title text NOT NULL)"
+    )
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS search_post_document_idx ON {POSTGRES_POST_TABLE} USING GIN (document)')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS search_post_title_trgm_idx ON {POSTGRES_POST_TABLE} USING GIN (title gin_trgm_ops)')
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {POSTGRES_USER_TABLE} ("
+        f"user_id integer PRIMARY KEY REFERENCES {t['user']} (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        f"document tsvector NOT NULL, names text NOT NULL)"
+    )
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS search_user_document_idx ON {POSTGRES_USER_TABLE} USING GIN (document)')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS search_user_names_trgm_idx ON {POSTGRES_USER_TABLE} USING GIN (names gin_trgm_ops)')
+    cursor.execute(
+        f"INSERT INTO {POSTGRES_POST_TABLE} (post_id, document, title) "
+        f"SELECT p.id, "
+        f"setweight(to_tsvector('simple', p.title), 'A') || "
+        f"setweight(to_tsvector('simple', COALESCE(p.content, '')), 'C') || "
+        f"setweight(to_tsvector('simple', u.username), 'B'), p.title "
+        f"FROM {t['post']} p JOIN {t['user']} u ON u.id = p.author_id"
+    )
+    cursor.execute(
+        f"INSERT INTO {POSTGRES_USER_TABLE} (user_id, document, names) "
+        f"SELECT u.id, "
+        f"setweight(to_tsvector('simple', u.username), 'A') || "
+        f"setweight(to_tsvector('simple', u.first_name), 'B') || "
+        f"setweight(to_tsvector('simple', u.last_name), 'B') || "
+        f"setweight(to_tsvector('simple', COALESCE(pr.bio, '')), 'C'), "
+        f"concat_ws(' ', u.username, u.first_name, u.last_name) "
+        f"FROM {t['user']} u LEFT JOIN {t['profile']} pr ON pr.user_id = u.id"
+    )
+
+
+def create_index(apps, schema_editor):
+    conn = schema_editor.connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            _create_postgres(cursor, _tables(apps))
+        elif conn.vendor == 'sqlite' and _sqlite_has_fts5(cursor):
+            _create_sqlite(cursor, _tables(apps))
+        # Other databases search with substring scans and need no index
+
+
+def drop_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor == 'postgresql':
+        tables = (POSTGRES_POST_TABLE, POSTGRES_USER_TABLE)
+    elif conn.vendor == 'sqlite':
+        tables = (SQLITE_POST_TABLE, SQLITE_USER_TABLE)
+    else:
+        return
+    with conn.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_comment_post_reply_id_idx'),
+        ('users', '0013_profile_last_seen_profile_show_online_status_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
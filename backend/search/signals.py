@@ -0,0 +1,45 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from blog.models import Post
+from users.models import Profile
+from . import engine
+
+
+""" Keeping the post index in step with post writes """
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, update_fields=None, **kwargs):
+    # Counter updates and the like don't touch searchable text
+    if update_fields is not None and not {'title', 'content', 'author'} & set(update_fields):
+        return
+    engine.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    engine.remove_post(instance.pk)
+
+
+""" Keeping the user index in step with user and profile writes """
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {'username', 'first_name', 'last_name'} & set(update_fields):
+        return  # e.g. the last_login bump on every login
+    # The user's own document is written by profile_saved: every User save
+    # also saves the profile (users.signals.save_profile)
+    if not created:
+        engine.rename_author(instance)
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return  # save_profile saves the new profile again straight away
+    if update_fields is not None and not {'bio', 'user'} & set(update_fields):
+        return
+    engine.index_user(instance.user, instance.bio)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    engine.remove_user(instance.pk)
@@ -0,0 +1,40 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import TestCase
+
+from search import engine
+from users.models import Profile
+
+
+class SearchIndexTests(TestCase):
+    def test_new_user_is_indexed_once(self):
+        with mock.patch.object(engine, 'index_user', wraps=engine.index_user) as index_user:
+            user = User.objects.create_user('zanzibar', 'z@example.com', 'pw')
+        self.assertEqual(index_user.call_count, 1)
+        self.assertEqual(engine.search_users('zanzibar')[0], [user.id])
+
+    def test_login_does_not_reindex_user(self):
+        user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        with mock.patch.object(engine, 'index_user', wraps=engine.index_user) as index_user:
+            self.assertTrue(self.client.login(username='alice', password='pw'))
+        self.assertEqual(index_user.call_count, 0)
+        self.assertIsNotNone(User.objects.get(pk=user.pk).last_login)
+
+    def test_bio_and_rename_reach_the_index(self):
+        user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        profile = Profile.objects.get(user=user)
+        profile.bio = 'lighthouse keeper'
+        profile.save()
+        self.assertEqual(engine.search_users('lighthouse')[0], [user.id])
+        user.username = 'alicia'
+        user.save()
+        self.assertEqual(engine.search_users('alicia')[0], [user.id])
+
+    def test_failed_index_write_leaves_transaction_usable(self):
+        backend = engine.get_backend()
+        with mock.patch.object(type(backend), 'index_user', side_effect=DatabaseError('boom')):
+            with self.assertLogs('search.engine', level='ERROR'):
+                user = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
@@ -0,0 +1,117 @@
+"""
+Token authentication with an in-process LRU + TTL cache.
+
+`token_required` runs on nearly every API call, so resolving a token should
+not cost two queries each time. Cache entries only live for a short TTL,
+which bounds how long a token revoked by another worker keeps working here.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+
+TOKEN_EXPIRY_SECONDS = getattr(settings, 'TOKEN_EXPIRY_SECONDS', 86400)
+
+
+class TokenCache:
+    """Thread-safe LRU of token key -> (user, token created, cached at)"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def set(self, key, user, created):
+        with self._lock:
+            self._entries[key] = (user, created, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[0].pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+token_cache = TokenCache(
+    maxsize=getattr(settings, 'TOKEN_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 60),
+)
+
+
+def get_token_key(request):
+    """Token key from a `Token <key>` or `Bearer <key>` Authorization header"""
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not (auth_header.startswith('Token ') or auth_header.startswith('Bearer ')):
+        return None
+    parts = auth_header.split(' ')
+    return parts[1] if len(parts) > 1 and parts[1] else None
+
+
+def is_token_expired(created):
+    return (timezone.now() - created).total_seconds() > TOKEN_EXPIRY_SECONDS
+
+
+def authenticate_token(token_key):
+    """
+    Resolve a token key to its user.
+    Returns (user, None) on success or (None, error message).
+    """
+    entry = token_cache.get(token_key)
+    if entry is None:
+        token = Token.objects.select_related('user').filter(key=token_key).first()
+        if token is None:
+            return None, 'Invalid token'
+        entry = (token.user, token.created)
+        token_cache.set(token_key, *entry)
+
+    user, created = entry
+    if is_token_expired(created):
+        token_cache.invalidate(token_key)
+        return None, 'Token expired'
+
+    # Hand out a copy so per-request state (cached relations) never leaks
+    # into the shared cache entry
+    return copy.copy(user), None
@@ -0,0 +1,209 @@
+"""
+In-process username autocomplete.
+
+Each process keeps every username and display name in sorted arrays of
+lowercased keys, a flattened prefix trie: all keys sharing a prefix sit in
+one contiguous run that starts where a binary search lands. Availability checks and
+top-K prefix lookups then cost microseconds and no queries.
+
+The index is built lazily on first use from a compact snapshot of
+(id, username, first name, last name) rows kept in the Django cache.
+Writes in this process are applied in place by the User signals. Each write
+also bumps a version counter in the cache and stores the changed row under
+that version, so other processes catch up by replaying the changes they
+missed, checking at most once every MIN_RELOAD_INTERVAL seconds. They read
+the whole table again only when too many changes piled up or some expired.
+Registration still relies on the database's unique constraint, so a
+briefly stale "available" answer is harmless.
+"""
+import bisect
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+
+SNAPSHOT_KEY = 'autocomplete:snapshot'
+VERSION_KEY = 'autocomplete:version'
+CHANGE_KEY = 'autocomplete:change:{}'
+CHANGE_TTL = 60 * 60 * 24
+MAX_REPLAY = 1000
+MIN_RELOAD_INTERVAL = 30
+DEFAULT_LIMIT = 10
+
+
+def _name_keys(first_name, last_name):
+    first, last = (first_name or '').strip().lower(), (last_name or '').strip().lower()
+    keys = {k for k in (first, last) if k}
+    if first and last:
+        keys.add(f'{first} {last}')
+    return keys
+
+
+class PrefixIndex:
+    def __init__(self, rows=()):
+        self._users = {row[0]: tuple(row[1:]) for row in rows}  # user id -> (username, first, last)
+        # Sorted (key, user id) arrays; usernames rank before names
+        self._usernames = sorted((username.lower(), user_id) for user_id, (username, _, _) in self._users.items())
+        self._names = sorted(
+            (key, user_id)
+            for user_id, (_, first, last) in self._users.items()
+            for key in _name_keys(first, last)
+        )
+        # Availability is case-insensitive, but usernames themselves are not
+        self._by_username = {}
+        for key, user_id in self._usernames:
+            self._by_username.setdefault(key, set()).add(user_id)
+
+    def __len__(self):
+        return len(self._users)
+
+    @staticmethod
+    def _insort(array, item):
+        i = bisect.bisect_left(array, item)
+        if i == len(array) or array[i] != item:
+            array.insert(i, item)
+
+    @staticmethod
+    def _discard(array, item):
+        i = bisect.bisect_left(array, item)
+        if i < len(array) and array[i] == item:
+            del array[i]
+
+    def remove(self, user_id):
+        fields = self._users.pop(user_id, None)
+        if fields is None:
+            return
+        username, first, last = fields
+        self._discard(self._usernames, (username.lower(), user_id))
+        holders = self._by_username.get(username.lower())
+        if holders is not None:
+            holders.discard(user_id)
+            if not holders:
+                del self._by_username[username.lower()]
+        for key in _name_keys(first, last):
+            self._discard(self._names, (key, user_id))
+
+    def upsert(self, user_id, username, first_name='', last_name=''):
+        self.remove(user_id)
+        self._users[user_id] = (username, first_name or '', last_name or '')
+        self._insort(self._usernames, (username.lower(), user_id))
+        self._by_username.setdefault(username.lower(), set()).add(user_id)
+        for key in _name_keys(first_name, last_name):
+            self._insort(self._names, (key, user_id))
+
+    def is_taken(self, username):
+        return username.lower() in self._by_username
+
+    @staticmethod
+    def _prefix_run(array, prefix):
+        """Entries of a sorted key array starting with `prefix`, in order"""
+        i = bisect.bisect_left(array, (prefix,))
+        while i < len(array) and array[i][0].startswith(prefix):
+            yield array[i]
+            i += 1
+
+    def complete(self, prefix, limit=DEFAULT_LIMIT, exclude_id=None):
+        """
+        Up to `limit` user ids whose username or name starts with `prefix`:
+        username matches first, each group in alphabetical order.
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        found = []
+        seen = {exclude_id}
+        for array in (self._usernames, self._names):
+            for _, user_id in self._prefix_run(array, prefix):
+                if user_id in seen:
+                    continue
+                seen.add(user_id)
+                found.append(user_id)
+                if len(found) >= limit:
+                    return found
+        return found
+
+
+_index = None
+_index_version = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def _apply(index, change):
+    user_id, fields = change
+    if fields is None:
+        index.remove(user_id)
+    else:
+        index.upsert(user_id, *fields)
+
+
+def _replay(index, since, version):
+    """Apply the changes after `since` up to `version`; False if any are gone"""
+    if version - since > MAX_REPLAY:
+        return False
+    keys = [CHANGE_KEY.format(v) for v in range(since + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return False
+    for key in keys:
+        _apply(index, changes[key])
+    return True
+
+
+def _load(version):
+    """A fresh index from the cached snapshot plus later changes, else the database"""
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is not None and snapshot[0] <= version:
+        index = PrefixIndex(snapshot[1])
+        if _replay(index, snapshot[0], version):
+            return index
+    rows = list(User.objects.values_list('id', 'username', 'first_name', 'last_name'))
+    cache.set(SNAPSHOT_KEY, (version, rows), None)
+    return PrefixIndex(rows)
+
+
+def get_index():
+    """This process's index, caught up with changes made by other processes"""
+    global _index, _index_version, _loaded_at
+    with _lock:
+        now = time.monotonic()
+        if _index is not None and now - _loaded_at < MIN_RELOAD_INTERVAL:
+            return _index
+        version = cache.get(VERSION_KEY, 0)
+        if _index is None or version < _index_version or not _replay(_index, _index_version, version):
+            _index = _load(version)
+        _index_version = version
+        _loaded_at = now
+        return _index
+
+
+def _changed(change):
+    """Apply a change locally and publish it for other processes"""
+    global _index_version
+    with _lock:
+        if _index is not None:
+            _apply(_index, change)
+        cache.add(VERSION_KEY, 0, None)
+        version = cache.incr(VERSION_KEY)
+        cache.set(CHANGE_KEY.format(version), change, CHANGE_TTL)
+        if _index is not None and _index_version == version - 1:
+            # Nobody else changed anything since our load, so we are current
+            _index_version = version
+
+
+def user_changed(user):
+    _changed((user.pk, (user.username, user.first_name or '', user.last_name or '')))
+
+
+def user_removed(user_id):
+    _changed((user_id, None))
+
+
+def is_username_taken(username):
+    return get_index().is_taken(username)
+
+
+def complete(prefix, limit=DEFAULT_LIMIT, exclude_id=None):
+    return get_index().complete(prefix, limit=limit, exclude_id=exclude_id)
@@ -42,20 +42,26 @@ class Profile(models.Model):
             self.last_seen = timezone.now()
         self.save()
 
-    def get_online_status_display(self, viewer_profile=None):
+    def get_online_status_display(self, viewer_profile=None, is_online=None, last_seen=None):
         """
         Get online status display text for a specific viewer
         Returns None if user doesn't want to show online status
+        `is_online`/`last_seen` override the stored values (e.g. from presence)
         """
         if not self.show_online_status:
             return None
 
-        if self.is_online:
+        if is_online is None:
+            is_online = self.is_online
+        if last_seen is None:
+            last_seen = self.last_seen
+
+        if is_online:
             return "Online"
         else:
             # Calculate time since last seen
             now = timezone.now()
-            time_diff = now - self.last_seen
+            time_diff = now - last_seen
 
             if time_diff.days > 0:
                 if time_diff.days == 1:
@@ -63,7 +69,7 @@ class Profile(models.Model):
                 elif time_diff.days < 7:
                     return f"Last seen {time_diff.days} days ago"
                 else:
-                    return f"Last seen {self.last_seen.strftime('%b %d')}"
+                    return f"Last seen {last_seen.strftime('%b %d')}"
             elif time_diff.seconds < 60:
                 return "Last seen just now"
             elif time_diff.seconds < 3600:
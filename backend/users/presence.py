@@ -0,0 +1,132 @@
+"""
+Presence registry.
+
+Socket counts and heartbeats live in the 'presence' cache, which is shared
+across processes when CACHE_REDIS_URL is set. A user is online while their
+heartbeat key is alive, and stays online while any of their sockets is open,
+whichever device asks to go offline. Socket counts expire with the heartbeat
+so counts leaked by a crashed worker heal themselves. The Profile row is only
+written when a user really goes online or offline, so reconnects and extra
+tabs cost no database writes.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from friend.models import FriendList
+from .models import Profile
+
+
+# Clients ping every 30 seconds; allow a couple of missed pings
+HEARTBEAT_TTL = getattr(settings, 'PRESENCE_HEARTBEAT_TTL', 90)
+# How long the last socket may be gone before the user is marked offline
+OFFLINE_GRACE = getattr(settings, 'PRESENCE_OFFLINE_GRACE', 10)
+# Open sockets heartbeat well within this, which keeps their count alive
+CONNECTIONS_TTL = HEARTBEAT_TTL * 2
+
+cache = caches['presence']
+
+
+def _connections_key(user_id):
+    return f'presence:conn:{user_id}'
+
+
+def _heartbeat_key(user_id):
+    return f'presence:hb:{user_id}'
+
+
+def _persisted_key(user_id):
+    return f'presence:db:{user_id}'
+
+
+def _persist(user_id, is_online):
+    """Write the transition to the Profile row unless it is already recorded"""
+    if cache.get(_persisted_key(user_id)) == is_online:
+        return
+    Profile.objects.filter(user_id=user_id).update(is_online=is_online, last_seen=timezone.now())
+    cache.set(_persisted_key(user_id), is_online, None)
+
+
+def heartbeat(user_id):
+    """Refresh the user's heartbeat. Returns True if they just came online"""
+    now = timezone.now()
+    came_online = cache.add(_heartbeat_key(user_id), now, HEARTBEAT_TTL)
+    cache.touch(_connections_key(user_id), CONNECTIONS_TTL)
+    if came_online:
+        _persist(user_id, True)
+    else:
+        cache.set(_heartbeat_key(user_id), now, HEARTBEAT_TTL)
+    return came_online
+
+
+def connect(user_id):
+    """Register an open socket. Returns True if the user just came online"""
+    cache.add(_connections_key(user_id), 0, CONNECTIONS_TTL)
+    cache.incr(_connections_key(user_id))
+    return heartbeat(user_id)
+
+
+def disconnect(user_id):
+    """
+    Unregister a socket. Returns True when it was the user's last one; the
+    caller should then call `settle_offline` after OFFLINE_GRACE seconds.
+    """
+    try:
+        remaining = cache.decr(_connections_key(user_id))
+    except ValueError:
+        remaining = 0
+    if remaining <= 0:
+        cache.set(_connections_key(user_id), 0, CONNECTIONS_TTL)
+        return True
+    return False
+
+
+def settle_offline(user_id):
+    """
+    Mark the user offline unless one of their sockets is still open, e.g. on
+    another device. Used after a socket's grace period and for explicit
+    offline requests (logout, status API). Returns True if they went offline.
+    """
+    if cache.get(_connections_key(user_id), 0) > 0:
+        return False
+    cache.delete(_heartbeat_key(user_id))
+    _persist(user_id, False)
+    return True
+
+
+def is_online(user_id):
+    return cache.get(_heartbeat_key(user_id)) is not None
+
+
+def online_ids(user_ids):
+    """Subset of `user_ids` that are currently online, in one cache round-trip"""
+    keys = {_heartbeat_key(user_id): user_id for user_id in user_ids}
+    return {keys[key] for key in cache.get_many(keys)}
+
+
+def last_seen(user_id, default=None):
+    """Time of the user's last heartbeat while online, else `default`"""
+    return cache.get(_heartbeat_key(user_id), default)
+
+
+def presence_group(user_id):
+    """Channel group a user's sockets listen on for their friends' presence"""
+    return f'presence_{user_id}'
+
+
+def audience(user_ids):
+    """
+    Map each of `user_ids` to the friend ids that should hear about their
+    presence, in one query. Users hiding their online status get no audience.
+    """
+    hidden = set(Profile.objects.filter(
+        user_id__in=user_ids, show_online_status=False
+    ).values_list('user_id', flat=True))
+    edges = FriendList.friends.through.objects.filter(
+        friendlist__user_id__in=set(user_ids) - hidden
+    ).values_list('friendlist__user_id', 'user_id')
+
+    friends = {}
+    for user_id, friend_id in edges:
+        friends.setdefault(user_id, []).append(friend_id)
+    return friends
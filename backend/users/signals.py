@@ -1,8 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
 from .models import Profile, Relationship, PrivacySettings
 from friend.models import FriendList
+from .authentication import token_cache
+from . import autocomplete
 
 """ Creating profile when an user creates an account """
 @receiver(post_save, sender=User)
@@ -14,8 +16,13 @@ def create_profile(sender, instance, created, **kwargs):
 
 """ Saving profile when an user updates his/her account """
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def save_profile(sender, instance, update_fields=None, **kwargs):
+    # The last_login bump on every login changes nothing the profile (or the
+    # search document its save rewrites) depends on
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        instance.profile.save()
+    # Drop cached token lookups so requests see the updated user
+    token_cache.invalidate_user(instance.pk)
 
 
 @receiver(post_save, sender=Relationship)
@@ -33,4 +40,17 @@ def post_save_add_to_friends(sender, created, instance, **kwargs):
 @receiver(post_save, sender=User)
 def create_friendlist(sender, instance, created, **kwargs):
     if created:
-        FriendList.objects.create(user=instance)
\ No newline at end of file
+        FriendList.objects.create(user=instance)
+
+
+""" Keeping the username autocomplete index current """
+@receiver(post_save, sender=User)
+def update_autocomplete(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'username', 'first_name', 'last_name'} & set(update_fields):
+        return  # e.g. the last_login bump on every login
+    autocomplete.user_changed(instance)
+
+
+@receiver(post_delete, sender=User)
+def remove_from_autocomplete(sender, instance, **kwargs):
+    autocomplete.user_removed(instance.pk)
@@ -1,3 +1,134 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
 from django.test import TestCase
+from rest_framework.authtoken.models import Token
 
-# Create your tests here.
+from users import autocomplete, presence
+from users.models import Profile
+
+
+class PresenceTests(TestCase):
+    def setUp(self):
+        caches['presence'].clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+
+    def _profile_online(self):
+        return Profile.objects.get(user=self.user).is_online
+
+    def test_first_socket_brings_user_online(self):
+        self.assertTrue(presence.connect(self.user.id))
+        self.assertFalse(presence.connect(self.user.id))
+        self.assertTrue(presence.is_online(self.user.id))
+        self.assertTrue(self._profile_online())
+
+    def test_user_stays_online_until_last_socket_closes(self):
+        presence.connect(self.user.id)
+        presence.connect(self.user.id)
+        self.assertFalse(presence.disconnect(self.user.id))
+        self.assertTrue(presence.disconnect(self.user.id))
+        self.assertTrue(presence.settle_offline(self.user.id))
+        self.assertFalse(presence.is_online(self.user.id))
+        self.assertFalse(self._profile_online())
+
+    def test_reconnect_during_grace_keeps_user_online(self):
+        presence.connect(self.user.id)
+        presence.disconnect(self.user.id)
+        presence.connect(self.user.id)
+        self.assertFalse(presence.settle_offline(self.user.id))
+        self.assertTrue(presence.is_online(self.user.id))
+
+    def test_offline_request_from_one_device_keeps_other_socket_online(self):
+        presence.connect(self.user.id)  # phone socket
+        presence.heartbeat(self.user.id)  # laptop via the REST API
+        self.assertFalse(presence.settle_offline(self.user.id))  # laptop logs out
+        self.assertTrue(presence.is_online(self.user.id))
+
+    def test_offline_request_without_sockets(self):
+        self.assertTrue(presence.heartbeat(self.user.id))
+        self.assertTrue(presence.settle_offline(self.user.id))
+        self.assertFalse(presence.is_online(self.user.id))
+
+    def test_disconnect_without_count_does_not_go_negative(self):
+        self.assertTrue(presence.disconnect(self.user.id))
+        self.assertTrue(presence.connect(self.user.id))
+        self.assertFalse(presence.settle_offline(self.user.id))
+
+    def test_online_ids(self):
+        other = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        presence.heartbeat(self.user.id)
+        self.assertEqual(presence.online_ids([self.user.id, other.id]), {self.user.id})
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self._forget_index()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw', first_name='Alice', last_name='Liddell')
+
+    def _forget_index(self):
+        # What another process, with no index of its own yet, would see
+        autocomplete._index = None
+        autocomplete._index_version = None
+
+    def test_prefix_matches_usernames_before_names(self):
+        albert = User.objects.create_user('albert', 'albert@example.com', 'pw')
+        lidia = User.objects.create_user('lidia', 'lidia@example.com', 'pw')
+        self.assertEqual(autocomplete.complete('al'), [albert.id, self.alice.id])
+        self.assertEqual(autocomplete.complete('li'), [lidia.id, self.alice.id])
+        self.assertEqual(autocomplete.complete('alice liddell'), [self.alice.id])
+
+    def test_usernames_differing_in_case_are_tracked_separately(self):
+        upper = User.objects.create_user('Alice', 'other@example.com', 'pw')
+        self.assertTrue(autocomplete.is_username_taken('ALICE'))
+        upper.delete()
+        self.assertTrue(autocomplete.is_username_taken('alice'))
+        self.alice.delete()
+        self.assertFalse(autocomplete.is_username_taken('alice'))
+
+    def test_other_processes_replay_changes_without_reloading(self):
+        autocomplete.get_index()
+        stale = autocomplete._index
+        autocomplete._loaded_at = 0.0
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.alice.username = 'alicia'
+        self.alice.save()
+        # Changes made elsewhere: this process's index never saw them
+        stale.remove(bob.id)
+        stale.upsert(self.alice.id, 'alice', 'Alice', 'Liddell')
+        autocomplete._index_version -= 2
+
+        with self.assertNumQueries(0):
+            self.assertTrue(autocomplete.is_username_taken('bob'))
+        self.assertIs(autocomplete._index, stale)
+        self.assertFalse(autocomplete.is_username_taken('alice'))
+        self.assertEqual(autocomplete.complete('alic'), [self.alice.id])
+
+    def test_new_process_builds_from_snapshot_and_changes(self):
+        autocomplete.get_index()
+        self._forget_index()
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self._forget_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete.complete('b'), [bob.id])
+
+    def test_missing_change_falls_back_to_the_database(self):
+        autocomplete.get_index()
+        self._forget_index()
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        cache.delete(autocomplete.CHANGE_KEY.format(cache.get(autocomplete.VERSION_KEY)))
+        self._forget_index()
+        self.assertEqual(autocomplete.complete('b'), [bob.id])
+
+    def test_single_word_search_still_matches_bios(self):
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        bob.profile.bio = 'alpine climber'
+        bob.profile.save()
+        headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=bob).key}'}
+        carol = User.objects.create_user('carol', 'carol@example.com', 'pw')
+        carol.profile.bio = 'alpine guide'
+        carol.profile.save()
+        response = self.client.get('/user/search/', {'query': 'al'}, **headers)
+        ids = [user['id'] for user in response.json()['users']]
+        self.assertEqual(ids[0], self.alice.id)
+        self.assertIn(carol.id, ids)
+        self.assertNotIn(bob.id, ids)
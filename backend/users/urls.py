@@ -5,6 +5,7 @@ urlpatterns = [
     path('login/', views.custom_login, name='custom-login'),
     path('logout/', views.custom_logout, name='custom-logout'),
     path('refresh-token/', views.refresh_token, name='refresh-token'),
+    path('token-cache-stats/', views.token_cache_stats, name='token-cache-stats'),
     path('register/', views.register, name='register'),
     path('verify-otp/', views.verify_otp, name='verify-otp'),
     path('setup-profile/', views.setup_profile, name='setup-profile'),
@@ -1,13 +1,18 @@
 from friend.models import FriendList, FriendRequest
+from friend import graph as friend_graph
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm
 from .models import Profile, OTP, PrivacySettings
+from . import autocomplete, presence
+from chat.presence_events import publish_presence
 from django.contrib.auth.models import User
 from django.dispatch import receiver 
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from notification.models import Notification
+from blog import timeline
+from search import engine as search_engine
 import json
 import requests
 from django.conf import settings
@@ -20,8 +25,9 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils import timezone
-from django.db.models import Q
+from functools import wraps
 import logging
+from .authentication import authenticate_token, get_token_key, is_token_expired, token_cache, TOKEN_EXPIRY_SECONDS
 
 
 logger = logging.getLogger(__name__)
@@ -31,22 +37,20 @@ def token_required(view_func):
     """
     Decorator to authenticate users based on token in Authorization header
     Similar to @login_required but works with token authentication
+    Tokens are resolved through the cached lookup in users.authentication
     """
+    @wraps(view_func)
     def wrapper(request, *args, **kwargs):
-        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-        if not (auth_header.startswith('Token ') or auth_header.startswith('Bearer ')):
+        token_key = get_token_key(request)
+        if not token_key:
             return JsonResponse({'error': 'Authorization header required'}, status=401)
 
-        token_key = auth_header.split(' ')[1]
-
-        from rest_framework.authtoken.models import Token
-        try:
-            token = Token.objects.get(key=token_key)
-            # Set the user on the request object (always override any existing user)
-            request.user = token.user
-        except Token.DoesNotExist:
-            return JsonResponse({'error': 'Invalid token'}, status=401)
+        user, error = authenticate_token(token_key)
+        if user is None:
+            return JsonResponse({'error': error}, status=401)
 
+        # Set the user on the request object (always override any existing user)
+        request.user = user
         return view_func(request, *args, **kwargs)
     return wrapper
 
@@ -76,13 +80,13 @@ def validate_email_format(email):
 
 @receiver(user_logged_in)
 def got_online(sender, user, request, **kwargs):    
-    user.profile.is_online = True
-    user.profile.save()
+    if presence.heartbeat(user.id):
+        publish_presence(user.id, True)
 
 @receiver(user_logged_out)
 def got_offline(sender, user, request, **kwargs):   
-    user.profile.is_online = False
-    user.profile.save()
+    if user is not None and presence.settle_offline(user.id):
+        publish_presence(user.id, False)
 
 
 
@@ -97,15 +101,20 @@ def follow_unfollow_profile(request):
         pk = data.get('profile_pk')
         obj = Profile.objects.get(pk=pk)
 
-        if obj.user in my_profile.following.all():
-            my_profile.following.remove(obj.user)
-            notify = Notification.objects.filter(sender=request.user, notification_type=2)
+        # `following` relates profiles to profiles
+        if my_profile.following.filter(pk=obj.pk).exists():
+            my_profile.following.remove(obj)
+            timeline.remove_author(request.user.id, obj.user_id)
+            notify = Notification.objects.filter(sender=request.user, user=obj.user, notification_type=2)
             notify.delete()
+            now_following = False
         else:
-            my_profile.following.add(obj.user)
+            my_profile.following.add(obj)
+            timeline.backfill(request.user.id, obj.user_id)
             notify = Notification(sender=request.user, user=obj.user, notification_type=2)
             notify.save()
-        return JsonResponse({'following': obj.user.username, 'now_following': obj.user in my_profile.following.all()})
+            now_following = True
+        return JsonResponse({'following': obj.user.username, 'now_following': now_following})
     return JsonResponse({'error': 'invalid method'}, status=405)
 
 
@@ -234,9 +243,9 @@ def check_username(request):
     if not re.match(r'^[a-zA-Z0-9_]+$', username):
         return JsonResponse({'error': 'Username can only contain letters, numbers, and underscores'}, status=400)
     
-    # Check if username is available
+    # Check if username is available (in-memory index, no query)
     try:
-        user_exists = User.objects.filter(username__iexact=username).exists()
+        user_exists = autocomplete.is_username_taken(username)
         return JsonResponse({
             'available': not user_exists,
             'username': username
@@ -418,7 +427,7 @@ def profile(request):
             'id': p.id,
             'image': p.image.url if p.image else None,
             'bio': getattr(p, 'bio', ''),
-            'is_online': getattr(p, 'is_online', False),
+            'is_online': presence.is_online(request.user.id),
         }
     })
 
@@ -493,7 +502,8 @@ def public_profile(request, username):
 @token_required
 @require_http_methods(["GET"])
 def profile_list(request):
-    profiles = Profile.objects.all().exclude(user=request.user)
+    profiles = Profile.objects.select_related('user').exclude(user=request.user)
+    online = presence.online_ids(profiles.values_list('user_id', flat=True))
     return JsonResponse({'profiles': [
         {
             'id': p.id,
@@ -503,13 +513,13 @@ def profile_list(request):
                 'first_name': p.user.first_name,
                 'last_name': p.user.last_name
             },
-            'is_online': getattr(p, 'is_online', False)
+            'is_online': p.user_id in online
         } for p in profiles
     ]})
 
 @token_required
 def search_users(request):
-    """Search for users by username, first name, or last name"""
+    """Search for users by username, first name, last name or bio (ranked, prefix matching)"""
     query = request.GET.get('query', '').strip()
     
     if not query or len(query) < 1:
@@ -518,43 +528,52 @@ def search_users(request):
     if len(query) > 100:
         query = query[:100]  # Limit query length
     
-    # Search users by username, first name, or last name
-    users = User.objects.filter(
-        Q(username__icontains=query) |
-        Q(first_name__icontains=query) |
-        Q(last_name__icontains=query)
-    ).exclude(id=request.user.id)[:20]  # Limit to 20 results and exclude current user
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+        limit = max(1, min(int(request.GET.get('limit', 20)), search_engine.SEARCH_MAX_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'invalid page'}, status=400)
+
+    terms = search_engine.query_terms(query)
+    if len(terms) == 1:
+        # Single word, i.e. typing ahead: name matches come from the in-memory
+        # prefix index, and the search index only fills a page it can't (bios)
+        wanted = page * limit + 1
+        matches = autocomplete.complete(terms[0], limit=wanted, exclude_id=request.user.id)
+        if len(matches) < wanted:
+            more, _ = search_engine.search_users(
+                query, limit=wanted + len(matches), exclude_id=request.user.id
+            )
+            seen = set(matches)
+            matches += [user_id for user_id in more if user_id not in seen][:wanted - len(matches)]
+        user_ids, has_more = matches[(page - 1) * limit:page * limit], len(matches) > page * limit
+    else:
+        # Ranked, prefix-matched lookup in the search index
+        user_ids, has_more = search_engine.search_users(query, page=page, limit=limit, exclude_id=request.user.id)
+    found = User.objects.select_related('profile').in_bulk(user_ids)
+    users = [found[user_id] for user_id in user_ids if user_id in found]
+    online = presence.online_ids([user.id for user in users])
     
     user_data = []
     for user in users:
-        try:
-            profile = Profile.objects.get(user=user)
-            user_data.append({
-                'id': user.id,
-                'username': user.username,
-                'first_name': user.first_name or '',
-                'last_name': user.last_name or '',
-                'email': user.email or '',
-                'is_online': profile.is_online,
-                'bio': profile.bio or '',
-                'image': profile.image.url if profile.image else '/media/default.jpg',
-            })
-        except Profile.DoesNotExist:
-            user_data.append({
-                'id': user.id,
-                'username': user.username,
-                'first_name': user.first_name or '',
-                'last_name': user.last_name or '',
-                'email': user.email or '',
-                'is_online': False,
-                'bio': '',
-                'image': '/media/default.jpg',
-            })
+        profile = getattr(user, 'profile', None)
+        user_data.append({
+            'id': user.id,
+            'username': user.username,
+            'first_name': user.first_name or '',
+            'last_name': user.last_name or '',
+            'email': user.email or '',
+            'is_online': user.id in online if profile else False,
+            'bio': (profile.bio or '') if profile else '',
+            'image': profile.image.url if profile and profile.image else '/media/default.jpg',
+        })
     
     return JsonResponse({
         'users': user_data,
         'count': len(user_data),
-        'query': query
+        'query': query,
+        'page': page,
+        'has_more': has_more,
     })
 
 """ User profile details view """
@@ -563,7 +582,7 @@ def search_users(request):
 def profile_detail(request, pk):
     view_profile = Profile.objects.get(pk=pk)
     my_profile = Profile.objects.get(user=request.user)
-    follow = view_profile.user in my_profile.following.all()
+    follow = my_profile.following.filter(pk=view_profile.pk).exists()
 
     account = view_profile.user
     try:
@@ -574,7 +593,7 @@ def profile_detail(request, pk):
     friends = friend_list.friends.all()
 
     is_self = request.user == account
-    is_friend = bool(friends.filter(pk=request.user.id))
+    is_friend = friend_graph.are_friends(account.id, request.user.id)
     request_sent = FriendRequestStatus.NO_REQUEST_SENT.value
     pending_friend_request_id = None
     if request.user.is_authenticated and request.user != account:
@@ -592,7 +611,7 @@ def profile_detail(request, pk):
     friend_requests = None
     if request.user.is_authenticated and is_self:
         try:
-            friend_requests = FriendRequest.objects.filter(receiver=request.user, is_active=True)
+            friend_requests = FriendRequest.objects.filter(receiver=request.user, is_active=True).select_related('sender', 'receiver')
         except:
             pass
 
@@ -607,7 +626,7 @@ def profile_detail(request, pk):
         },
         'bio': view_profile.bio or '',
         'image': view_profile.image.url if view_profile.image else '/media/default.jpg',
-        'is_online': view_profile.is_online,
+        'is_online': presence.is_online(account.id),
         'follow': follow,
         'friends_count': len(friends),
         'followers_count': view_profile.get_followers_no(),
@@ -615,6 +634,7 @@ def profile_detail(request, pk):
         'friends': [{'id': f.id, 'username': f.username} for f in friends],
         'is_self': is_self,
         'is_friend': is_friend,
+        'mutual_friends_count': 0 if is_self else friend_graph.mutual_count(request.user.id, account.id),
         'request_sent': request_sent,
         'pending_friend_request_id': pending_friend_request_id,
         'friend_requests': [
@@ -633,6 +653,7 @@ def get_followers(request, user_id):
         profile = Profile.objects.get(user=user)
         
         followers = []
+        online = presence.online_ids(profile.followers.values_list('user_id', flat=True))
         for follower in profile.followers.all():
             followers.append({
                 'id': follower.id,
@@ -643,7 +664,7 @@ def get_followers(request, user_id):
                     'last_name': follower.user.last_name,
                     'email': follower.user.email
                 },
-                'is_online': follower.is_online,
+                'is_online': follower.user_id in online,
                 'bio': follower.bio or '',
                 'image': follower.image.url if follower.image else '/media/default.jpg'
             })
@@ -718,6 +739,7 @@ def custom_login(request):
                     if not created:
                         token.created = timezone.now()
                         token.save()
+                        token_cache.invalidate(token.key)
 
                     # Get or create user profile
                     profile, profile_created = Profile.objects.get_or_create(user=user)
@@ -725,7 +747,7 @@ def custom_login(request):
                     return JsonResponse({
                         'token': token.key,
                         'token_type': 'Bearer',
-                        'expires_in': 86400,  # 24 hours in seconds
+                        'expires_in': TOKEN_EXPIRY_SECONDS,
                         'user': {
                             'id': user.id,
                             'username': user.username,
@@ -771,6 +793,7 @@ def custom_logout(request):
                 token.delete()  # Delete the token to invalidate it
             except Token.DoesNotExist:
                 pass
+            token_cache.invalidate(token_key)
 
         # Clear session if it exists
         if hasattr(request, 'user') and request.user.is_authenticated:
@@ -804,15 +827,14 @@ def refresh_token(request):
         token_key = auth_header.split(' ')[1]
 
         from rest_framework.authtoken.models import Token
+        token_cache.invalidate(token_key)
         try:
-            token = Token.objects.get(key=token_key)
+            token = Token.objects.select_related('user').get(key=token_key)
         except Token.DoesNotExist:
             return JsonResponse({'error': 'Invalid token'}, status=401)
 
-        # Check if token is expired (24 hours)
-        from django.utils import timezone
-        token_age = timezone.now() - token.created
-        if token_age.total_seconds() > 86400:  # 24 hours
+        # Check if token is expired
+        if is_token_expired(token.created):
             token.delete()
             return JsonResponse({'error': 'Token expired'}, status=401)
 
@@ -823,7 +845,7 @@ def refresh_token(request):
         return JsonResponse({
             'token': new_token.key,
             'token_type': 'Bearer',
-            'expires_in': 86400,
+            'expires_in': TOKEN_EXPIRY_SECONDS,
             'user': {
                 'id': token.user.id,
                 'username': token.user.username,
@@ -852,13 +874,17 @@ def update_online_status(request):
         data = json.loads(request.body)
         is_online = data.get('is_online', False)
 
-        profile = request.user.profile
-        profile.update_online_status(is_online)
+        if is_online:
+            changed = presence.heartbeat(request.user.id)
+        else:
+            changed = presence.settle_offline(request.user.id)
+        if changed:
+            publish_presence(request.user.id, bool(is_online))
 
         return JsonResponse({
             'success': True,
-            'is_online': profile.is_online,
-            'last_seen': profile.last_seen.isoformat()
+            'is_online': bool(is_online),
+            'last_seen': timezone.now().isoformat()
         })
 
     except Exception as e:
@@ -881,13 +907,17 @@ def get_online_status(request, user_id):
                 'is_visible': False
             })
 
-        online_status = target_profile.get_online_status_display(request.user.profile)
+        is_online = presence.is_online(target_user.id)
+        last_seen = presence.last_seen(target_user.id, target_profile.last_seen)
+        online_status = target_profile.get_online_status_display(
+            request.user.profile, is_online=is_online, last_seen=last_seen
+        )
 
         return JsonResponse({
             'user_id': user_id,
             'online_status': online_status,
-            'is_online': target_profile.is_online,
-            'last_seen': target_profile.last_seen.isoformat(),
+            'is_online': is_online,
+            'last_seen': last_seen.isoformat(),
             'is_visible': True
         })
 
@@ -965,3 +995,11 @@ def update_privacy_settings(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+
+""" Token cache counters """
+@token_required
+@require_http_methods(["GET"])
+def token_cache_stats(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    return JsonResponse(token_cache.stats())
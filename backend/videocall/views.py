@@ -6,6 +6,7 @@ import time
 from agora_token_builder import RtcTokenBuilder
 
 from friend.models import FriendList
+from friend import graph as friend_graph
 from .models import RoomMember
 import json
 from django.views.decorators.csrf import csrf_exempt
@@ -39,12 +40,7 @@ def room(request):
     #     redirect('vc-lobby')
 
 def validateVC(request,vc_to):
-    friends = FriendList.objects.filter(user=request.user)[0].friends.all()
-    id_list = list(friends.values_list('id',flat=True))
-    if vc_to in id_list:
-        return True
-    else:
-        return False
+    return friend_graph.are_friends(request.user.id, vc_to)
 
 def getToken(request):
     appId = os.environ.get('AGORA_APP_ID')